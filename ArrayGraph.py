@@ -0,0 +1,363 @@
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+'''
+ArrayGraph is a compact stand-in for the networkx Graph that the Network class stores its lattices in.
+Node positions live in one contiguous (N, 3) float array and the edges in a CSR style adjacency (indptr/indices),
+with an alive mask marking which node labels are still part of the lattice. It implements the parts of the networkx
+Graph API that Network uses, so every Network method runs on it unchanged --> create one with Network(backend='array')
+Labels are always the integers 0..N-1 (same as the index in nodexvals/nodeyvals/nodezvals), removed nodes just get masked out
+'''
+
+
+class NodeView:
+    '''
+    Mimics G.nodes from networkx --> iterate over the alive labels, G.nodes[i]['pos'] gives the coordinates of node i
+    '''
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        self._graph._flush()
+        return iter(np.flatnonzero(self._graph.alive).tolist())
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+    def __contains__(self, n):
+        return self._graph.has_node(n)
+
+    def __getitem__(self, n):
+        self._graph._check(n)
+        return {'pos': self._graph.coords[n]}   # row of the coordinate array, not a copy
+
+    def __call__(self):
+        return self
+
+
+class DegreeView:
+    '''
+    Mimics G.degree from networkx --> G.degree[i] is the valence of node i, iterating (or G.degree()) gives (node, valence) pairs
+    '''
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, n):
+        self._graph._check(n)
+        return int(self._graph.deg[n])
+
+    def __iter__(self):
+        self._graph._flush()
+        nodes = np.flatnonzero(self._graph.alive)
+        return zip(nodes.tolist(), self._graph.deg[nodes].tolist())
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+    def __call__(self, nbunch=None):
+        if nbunch is None:
+            return self
+        return self[nbunch]
+
+
+class ArrayGraph:
+
+    def __init__(self, coords=None, edges=None):
+
+        self.coords = np.empty((0, 3))                  # (N, 3) node coordinates, row index is the node label
+        self.alive = np.empty(0, dtype=bool)            # False for labels that have been removed
+        self.deg = np.empty(0, dtype=np.int32)          # valence of each node, kept up to date as edges/nodes change
+
+        self.indptr = np.zeros(1, dtype=np.int64)       # CSR adjacency --> neighbours of i are indices[indptr[i]:indptr[i+1]]
+        self.indices = np.empty(0, dtype=np.int32)      # can still contain removed nodes, they are filtered with the alive mask
+
+        self._extra = {}        # node -> list of neighbours added one at a time with add_edge since the CSR was last built
+        self._newnodes = []     # positions added with add_node that haven't been appended to self.coords yet
+        self._shared = False    # True while coords/alive/deg are shared with a copy(shared=True), see _own()
+
+        if coords is not None:
+            self.add_nodes(coords)
+        if edges is not None:
+            self.add_edges_from(edges)
+
+    @property
+    def nodes(self):
+        return NodeView(self)
+
+    @property
+    def degree(self):
+        return DegreeView(self)
+
+    @property
+    def nbytes(self):
+        '''
+        memory used by the node and edge arrays in bytes
+        '''
+        self._flush()
+        return self.coords.nbytes + self.alive.nbytes + self.deg.nbytes + self.indptr.nbytes + self.indices.nbytes
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, n):
+        return self.has_node(n)
+
+    def _flush(self):
+        '''
+        appends any nodes added one at a time with add_node to the arrays
+        '''
+        if len(self._newnodes) == 0:
+            return
+
+        new = np.array(self._newnodes, dtype=float).reshape(-1, 3)
+        self._newnodes = []
+
+        self.coords = np.vstack((self.coords, new))
+        self.alive = np.concatenate((self.alive, np.ones(len(new), dtype=bool)))
+        self.deg = np.concatenate((self.deg, np.zeros(len(new), dtype=np.int32)))
+        self.indptr = np.concatenate((self.indptr, np.full(len(new), self.indptr[-1])))
+
+    def _own(self):
+        '''
+        gives this graph its own copy of the arrays it shares with a copy(shared=True) before they get changed in place
+        '''
+        if not self._shared:
+            return
+        self.coords = self.coords.copy()
+        self.alive = self.alive.copy()
+        self.deg = self.deg.copy()
+        self._shared = False
+
+    def _check(self, n):
+        if not self.has_node(n):
+            raise nx.NetworkXError("The node {} is not in the graph.".format(n))
+
+    def _rows(self, nodes):
+        '''
+        returns the CSR entries (neighbour labels, dead ones included) of all nodes in the integer array nodes, concatenated
+        '''
+        starts = self.indptr[nodes]
+        counts = self.indptr[nodes + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return self.indices[offsets + np.arange(counts.sum())]
+
+    def _rebuild(self, newedges=None):
+        '''
+        rebuilds the CSR arrays from the current edges plus newedges ((M, 2) array), dropping removed nodes, duplicates and self loops
+        '''
+        self._flush()
+        n = len(self.coords)
+
+        rows = [np.repeat(np.arange(n), np.diff(self.indptr))]
+        cols = [self.indices]
+
+        for u, vs in self._extra.items():
+            rows.append(np.full(len(vs), u))
+            cols.append(np.array(vs, dtype=np.int64))
+
+        if newedges is not None and len(newedges) != 0:
+            rows.extend((newedges[:, 0], newedges[:, 1]))
+            cols.extend((newedges[:, 1], newedges[:, 0]))
+
+        rows = np.concatenate(rows).astype(np.int64)
+        cols = np.concatenate(cols).astype(np.int64)
+
+        keep = self.alive[rows] & self.alive[cols] & (rows != cols)
+        rows = rows[keep]
+        cols = cols[keep]
+
+        adjacency = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+        adjacency.sum_duplicates()
+        adjacency.sort_indices()
+
+        self.indptr = adjacency.indptr.astype(np.int64)
+        self.indices = adjacency.indices.astype(np.int32)
+        self.deg = np.diff(self.indptr).astype(np.int32)
+        self._extra = {}
+
+    def add_nodes(self, coords):
+        '''
+        appends nodes with the given (M, 3) coordinates, they get the next M labels
+        '''
+        self._flush()
+        coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+
+        self.coords = np.vstack((self.coords, coords))
+        self.alive = np.concatenate((self.alive, np.ones(len(coords), dtype=bool)))
+        self.deg = np.concatenate((self.deg, np.zeros(len(coords), dtype=np.int32)))
+        self.indptr = np.concatenate((self.indptr, np.full(len(coords), self.indptr[-1])))
+
+    def add_node(self, node_for_adding, pos=None):
+        n = node_for_adding
+        total = len(self.coords) + len(self._newnodes)
+        pos = [np.nan]*3 if pos is None else pos
+
+        if n == total:
+            self._newnodes.append(pos)
+            return
+
+        self._flush()
+        if not 0 <= n < len(self.coords):
+            raise nx.NetworkXError("ArrayGraph labels must be consecutive, next label is {}".format(total))
+
+        self._own()
+        if not self.alive[n]:
+            self._rebuild()     # make sure none of its old edges come back with it
+            self.alive[n] = True
+        self.coords[n] = pos
+
+    def add_edge(self, u_of_edge, v_of_edge):
+        u, v = u_of_edge, v_of_edge
+        self._check(u)
+        self._check(v)
+
+        if u == v or self.has_edge(u, v):
+            return
+
+        self._own()
+        self._extra.setdefault(u, []).append(v)
+        self._extra.setdefault(v, []).append(u)
+        self.deg[u] += 1
+        self.deg[v] += 1
+
+    def add_edges_from(self, ebunch_to_add):
+        edges = np.asarray(ebunch_to_add, dtype=np.int64).reshape(-1, 2)
+        self._flush()
+
+        if np.any((edges < 0) | (edges >= len(self.coords))) or not self.alive[edges].all():
+            raise nx.NetworkXError("ArrayGraph can only add edges between nodes already in the graph")
+
+        self._rebuild(edges)
+
+    def remove_node(self, n):
+        self._check(n)
+        self.remove_nodes_from([n])
+
+    def remove_nodes_from(self, nodes):
+        self._flush()
+        nodes = np.unique(np.asarray(list(nodes), dtype=np.int64))
+        nodes = nodes[(nodes >= 0) & (nodes < len(self.coords))]
+        nodes = nodes[self.alive[nodes]]
+
+        if len(nodes) == 0:
+            return
+
+        self._own()
+        self.alive[nodes] = False
+
+        # every neighbour still alive loses one from its valence per removed neighbour
+        neighbours = [self._rows(nodes)]
+        for n in nodes.tolist():
+            neighbours.append(np.array(self._extra.pop(n, []), dtype=np.int64))
+        neighbours = np.concatenate(neighbours).astype(np.int64)
+
+        np.subtract.at(self.deg, neighbours[self.alive[neighbours]], 1)
+        self.deg[nodes] = 0
+
+    def has_node(self, n):
+        self._flush()
+        try:
+            return 0 <= n < len(self.coords) and bool(self.alive[n])
+        except TypeError:
+            return False
+
+    def has_edge(self, u, v):
+        if not (self.has_node(u) and self.has_node(v)):
+            return False
+        return v in self._extra.get(u, ()) or bool(np.any(self.indices[self.indptr[u]:self.indptr[u+1]] == v))
+
+    def neighbors(self, n):
+        self._check(n)
+        row = self.indices[self.indptr[n]:self.indptr[n+1]]
+        row = row[self.alive[row]].tolist()
+        extra = [v for v in self._extra.get(n, ()) if self.alive[v]]
+        return iter(row + extra)
+
+    def edge_array(self):
+        '''
+        returns every edge as an (E, 2) integer array with i < j in each row
+        '''
+        self._rebuild()
+        rows = np.repeat(np.arange(len(self.coords)), np.diff(self.indptr))
+        keep = rows < self.indices
+        return np.column_stack((rows[keep], self.indices[keep]))
+
+    def edges(self, nbunch=None):
+        if nbunch is None:
+            return [tuple(e) for e in self.edge_array().tolist()]
+        return [(nbunch, v) for v in self.neighbors(nbunch)]
+
+    def adjacency_matrix(self):
+        '''
+        returns the (N, N) adjacency as a scipy CSR matrix over all labels, removed nodes have empty rows
+        '''
+        self._rebuild()
+        n = len(self.coords)
+        return sparse.csr_matrix((np.ones(len(self.indices), dtype=np.int8), self.indices, self.indptr), shape=(n, n))
+
+    def number_of_nodes(self):
+        self._flush()
+        return int(np.count_nonzero(self.alive))
+
+    def number_of_edges(self):
+        self._flush()
+        return int(self.deg.sum())//2
+
+    def clear(self):
+        self.__init__()
+
+    def copy(self, shared=False):
+        '''
+        shared = True --> copy on write, both graphs keep using the same arrays (made read-only) until one of them changes
+        a node or an edge, so the copy is almost free (see LatticeCache.py)
+        '''
+        self._rebuild()
+        new = ArrayGraph()
+
+        if shared:
+            for a in (self.coords, self.alive, self.deg, self.indptr, self.indices):
+                a.setflags(write=False)
+            new.coords, new.alive, new.deg, new.indptr, new.indices = self.coords, self.alive, self.deg, self.indptr, self.indices
+            self._shared = new._shared = True
+            return new
+
+        new.coords = self.coords.copy()
+        new.alive = self.alive.copy()
+        new.deg = self.deg.copy()
+        new.indptr = self.indptr.copy()
+        new.indices = self.indices.copy()
+        return new
+
+    def to_networkx(self):
+        '''
+        exports the graph as a networkx Graph with the same labels and 'pos' attributes
+        '''
+        G = nx.Graph()
+        for n in self.nodes:
+            G.add_node(n, pos=self.coords[n].tolist())
+        G.add_edges_from(self.edge_array().tolist())
+        return G
+
+    @classmethod
+    def from_networkx(cls, G):
+        '''
+        builds an ArrayGraph from a networkx Graph whose nodes are integer labels with a 'pos' attribute
+        labels missing from 0..max(label) become removed nodes
+        '''
+        n = max(G.nodes) + 1 if len(G) != 0 else 0
+        coords = np.full((n, 3), np.nan)
+        for node, pos in G.nodes(data='pos'):
+            if pos is not None:
+                coords[node] = pos
+
+        new = cls(coords)
+        new.alive[:] = False
+        new.alive[list(G.nodes)] = True
+        new.add_edges_from(list(G.edges()))
+        return new
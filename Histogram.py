@@ -0,0 +1,96 @@
+import numpy as np
+
+'''
+Histogram is a fixed-bin histogram that values get folded into one batch at a time. It also keeps the running moments
+(count, mean, variance, min, max), so statistics like the angle distribution of a huge lattice never need all the raw
+values in memory --> see Network.findAngles(accumulate=True) and Network.plotDegree()
+'''
+
+
+class Histogram:
+
+    def __init__(self, start, stop, nbins):
+        '''
+        start, stop = range covered by the bins, values outside it are only counted in self.outside (and the moments)
+        nbins = number of equal width bins, the last bin includes stop
+        '''
+
+        self.edges = np.linspace(start, stop, nbins + 1)
+        self.counts = np.zeros(nbins, dtype=np.int64)
+
+        self.count = 0          # running moments of every (non nan) value added
+        self.mean = 0.0
+        self.m2 = 0.0           # sum of squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+        self.outside = 0        # values that fell outside [start, stop]
+        self.nans = 0           # nan values, not counted anywhere else
+
+    @property
+    def centers(self):
+        return (self.edges[:-1] + self.edges[1:])/2
+
+    @property
+    def width(self):
+        return self.edges[1] - self.edges[0]
+
+    @property
+    def variance(self):
+        return self.m2/self.count if self.count != 0 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def add(self, values):
+        '''
+        folds an array of values into the histogram and the running moments
+        '''
+
+        values = np.asarray(values, dtype=float).ravel()
+
+        nan = np.isnan(values)
+        self.nans += int(np.count_nonzero(nan))
+        values = values[~nan]
+
+        if len(values) == 0:
+            return
+
+        nbins = len(self.counts)
+        bins = np.floor((values - self.edges[0])/self.width).astype(np.int64)
+        bins[values == self.edges[-1]] = nbins - 1
+
+        inside = (bins >= 0) & (bins < nbins)
+        self.counts += np.bincount(bins[inside], minlength=nbins)
+        self.outside += int(np.count_nonzero(~inside))
+
+        mean = values.mean()
+        self._combine(len(values), mean, np.sum((values - mean)**2), values.min(), values.max())
+
+    def merge(self, other):
+        '''
+        adds everything counted by another Histogram with the same bins (e.g. one filled in another process)
+        '''
+
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("can only merge histograms with the same bins")
+
+        self.counts += other.counts
+        self.outside += other.outside
+        self.nans += other.nans
+
+        if other.count != 0:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, count, mean, m2, low, high):
+        # Chan et al. update for merging the moments of two sets of values
+        total = self.count + count
+        delta = mean - self.mean
+
+        self.mean += delta*count/total
+        self.m2 += m2 + delta**2*self.count*count/total
+        self.count = total
+
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
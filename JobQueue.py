@@ -0,0 +1,198 @@
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from multiprocessing.connection import wait
+
+from LRUStore import LRUStore
+
+'''
+JobQueue runs long jobs (e.g. generating or randomizing a big lattice for the Dash app) in the background, so a request only has to
+submit one and then poll it. Every job runs in its own process --> at most workers of them at once, the rest wait in a queue, and
+cancelling a running job terminates its process, which stops it straight away even in the middle of a stage.
+A job is a function called as function(*args, progress=progress) in the job process: every progress(done, total, step) call
+(see Network.runPipeline) updates the job's status, and what the function returns is kept in an LRUStore of results
+
+    jobs = JobQueue(workers=2)
+    job = jobs.submit(function, chain)
+    jobs.status(job)        --> {'state': 'running', 'done': 1, 'total': 7, 'step': 'randomize', 'error': None}
+    jobs.result(job)        --> once the state is 'done'
+    jobs.cancel(job)
+
+With a directory the statuses and results are also kept there, so every process of a multi-process server can poll (and cancel) a job
+that another one started. The job itself always runs under the process that submitted it
+'''
+
+
+def _work(connection, function, args):
+    '''
+    runs in the job process, sends ('progress', status), then ('done', result) or ('failed', traceback) back to the JobQueue
+    '''
+
+    def progress(done, total, step):
+        connection.send(('progress', {'done': done, 'total': total, 'step': step}))
+
+    try:
+        result = function(*args, progress=progress)
+    except Exception:
+        connection.send(('failed', traceback.format_exc()))
+    else:
+        connection.send(('done', result))
+
+    connection.close()
+
+
+class JobQueue:
+
+    def __init__(self, workers=2, maxitems=32, directory=None):
+        '''
+        workers = most jobs running at the same time (one process each)
+        maxitems = most finished jobs whose status and result are kept, the least recently used ones are evicted past that
+        directory = optional folder to also keep the statuses and results in (shared between processes, see LRUStore.py)
+        '''
+
+        self.workers = workers
+
+        self.statuses = LRUStore(maxitems=4*maxitems, directory=None if directory is None else os.path.join(directory, 'status'))
+        self.results = LRUStore(maxitems=maxitems, directory=None if directory is None else os.path.join(directory, 'results'))
+
+        self._queued = deque()      # (job, function, args) waiting for a free worker
+        self._running = {}          # job -> (process, connection) of the jobs started by this process
+        self._lock = threading.Lock()
+
+        # one thread collects the messages of every running job and starts the queued ones when a worker frees up
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def submit(self, function, *args):
+        '''
+        queues function(*args, progress=...) to run in a job process, returns the job id
+        '''
+
+        job = uuid.uuid4().hex
+
+        with self._lock:
+            self._queued.append((job, function, args))
+            self._setStatus(job, 'queued')
+            self._startQueued()
+
+        return job
+
+    def status(self, job):
+        '''
+        returns the status of a job --> dict of state ('queued', 'running', 'done', 'failed' or 'cancelled'), done/total stages,
+        the step it is on and the error (traceback) if it failed. None if the job is unknown (or was evicted)
+        '''
+        return self.statuses.get(job)
+
+    def result(self, job):
+        '''
+        returns what the job's function returned, None if it isn't done (or was evicted)
+        '''
+        return self.results.get(job)
+
+    def cancel(self, job):
+        '''
+        stops a job --> a queued one never starts and a running one has its process terminated. returns True if there was anything to stop
+        '''
+
+        with self._lock:
+            status = self.statuses.get(job)
+            if status is None or status['state'] not in ('queued', 'running'):
+                return False
+
+            if job not in self._running and all(queued[0] != job for queued in self._queued):
+                # started by another process of the server --> that process' listener terminates it
+                self.statuses.put(job + '/cancel', True)
+                return True
+
+            self._stop(job)
+            self._setStatus(job, 'cancelled')
+            self._startQueued()
+
+        return True
+
+    def _setStatus(self, job, state, error=None, **progress):
+        status = self.statuses.get(job) or {'done': 0, 'total': None, 'step': None}
+        status = dict(status, state=state, error=error, **progress)
+        self.statuses.put(job, status)
+
+    def _stop(self, job):
+        # called with the lock held
+        self._queued = deque(queued for queued in self._queued if queued[0] != job)
+
+        if job in self._running:
+            process, connection = self._running.pop(job)
+            process.terminate()
+            process.join()
+            connection.close()
+
+    def _startQueued(self):
+        # called with the lock held
+        while self._queued and len(self._running) < self.workers:
+            job, function, args = self._queued.popleft()
+
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_work, args=(sender, function, args), daemon=True)
+            process.start()
+            sender.close()      # only the job process writes to it
+
+            self._running[job] = (process, receiver)
+            self._setStatus(job, 'running')
+
+    def _listen(self):
+
+        while True:
+            with self._lock:
+                connections = {connection: job for job, (process, connection) in self._running.items()}
+
+                # cancelled from another process
+                for job in list(self._running):
+                    if job + '/cancel' in self.statuses:
+                        self._stop(job)
+                        self._setStatus(job, 'cancelled')
+                        self.statuses.pop(job + '/cancel')
+                self._startQueued()
+
+            if not connections:
+                time.sleep(0.2)
+                continue
+
+            try:
+                ready = wait(list(connections), timeout=0.2)
+            except (OSError, ValueError):
+                continue        # a job was cancelled (and its connection closed) since the snapshot above
+
+            for connection in ready:
+                try:
+                    kind, payload = connection.recv()
+                except (EOFError, OSError):
+                    kind, payload = 'failed', 'the job process stopped without finishing'
+
+                self._handle(connections[connection], kind, payload)
+
+    def _handle(self, job, kind, payload):
+
+        with self._lock:
+            if job not in self._running:
+                return      # cancelled while the message was on its way
+
+            if kind == 'progress':
+                self._setStatus(job, 'running', **payload)
+                return
+
+            process, connection = self._running.pop(job)
+            process.join()
+            connection.close()
+
+            if kind == 'done':
+                self.results.put(job, payload)
+                status = self.statuses.get(job) or {}
+                self._setStatus(job, 'done', done=status.get('total'))
+            else:
+                self._setStatus(job, 'failed', error=payload)
+
+            self._startQueued()
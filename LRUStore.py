@@ -0,0 +1,165 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+'''
+LRUStore is a small key -> object store with a bounded size and least-recently-used eviction.
+Without a directory it is a plain in-memory LRU cache (only visible inside one process). With a directory every object is also
+pickled to a file there, which is the copy that counts: any process pointed at the same directory sees the same objects, so the
+Dash app can run under a multi-process server (the in-memory copies are only used while the file hasn't changed)
+'''
+
+
+class LRUStore:
+
+    def __init__(self, maxitems=32, directory=None, memoryitems=None):
+        '''
+        maxitems = most objects kept, the least recently used ones are evicted past that
+        directory = optional folder to keep the pickled objects in (created if needed), None for memory only
+        memoryitems = most objects also kept unpickled in memory when a directory is used (defaults to maxitems)
+        '''
+
+        self.maxitems = maxitems
+        self.directory = directory
+        self.memoryitems = maxitems if memoryitems is None else memoryitems
+
+        self._memory = OrderedDict()    # key -> (file modification time or None, object), most recently used last
+        self._lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        # keys can be any string, so the file name is its hex encoding
+        return os.path.join(self.directory, str(key).encode().hex() + '.pkl')
+
+    def __contains__(self, key):
+        if self.directory is not None:
+            return os.path.exists(self._path(key))
+        return key in self._memory
+
+    def __len__(self):
+        if self.directory is not None:
+            return len([f for f in os.listdir(self.directory) if f.endswith('.pkl')])
+        return len(self._memory)
+
+    def get(self, key, default=None):
+        '''
+        returns the object stored under key (and marks it as recently used), or default
+        '''
+
+        with self._lock:
+            if self.directory is None:
+                if key not in self._memory:
+                    return default
+                self._memory.move_to_end(key)
+                return self._memory[key][1]
+
+            path = self._path(key)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self._memory.pop(key, None)
+                return default
+
+            if key in self._memory and self._memory[key][0] == mtime:
+                value = self._memory[key][1]
+            else:
+                try:
+                    with open(path, 'rb') as f:
+                        value = pickle.load(f)
+                except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                    return default
+
+            # touch the access time only, the modification time tells other processes' memory copies apart
+            try:
+                os.utime(path, ns=(time.time_ns(), mtime))
+            except FileNotFoundError:
+                # evicted by another process in the meantime --> a miss
+                self._memory.pop(key, None)
+                return default
+            self._remember(key, mtime, value)
+
+            return value
+
+    def put(self, key, value):
+        '''
+        stores value under key, evicting the least recently used objects if there are too many
+        '''
+
+        with self._lock:
+            if self.directory is None:
+                self._remember(key, None, value)
+                return
+
+            # write to a temporary file first so other processes never read a half written one
+            handle, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self._path(key))
+
+            try:
+                self._remember(key, os.stat(self._path(key)).st_mtime_ns, value)
+            except FileNotFoundError:
+                pass        # already evicted by another process
+            self._evictFiles()
+
+    def pop(self, key, default=None):
+        '''
+        removes key from the store and returns its object (or default)
+        '''
+
+        value = self.get(key, default)
+
+        with self._lock:
+            self._memory.pop(key, None)
+            if self.directory is not None:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.directory is not None:
+                for f in os.listdir(self.directory):
+                    if f.endswith('.pkl'):
+                        try:
+                            os.remove(os.path.join(self.directory, f))
+                        except FileNotFoundError:
+                            pass
+
+    def _remember(self, key, mtime, value):
+        self._memory[key] = (mtime, value)
+        self._memory.move_to_end(key)
+
+        limit = self.maxitems if self.directory is None else self.memoryitems
+        while len(self._memory) > limit:
+            self._memory.popitem(last=False)
+
+    def _evictFiles(self):
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.pkl')]
+
+        if len(files) <= self.maxitems:
+            return
+
+        # least recently used first (access time is updated on every get), files other processes removed since listdir are already evicted
+        accessed = {}
+        for f in files:
+            try:
+                accessed[f] = os.stat(f).st_atime_ns
+            except FileNotFoundError:
+                pass
+
+        files = sorted(accessed, key=accessed.get)
+        for f in files[:len(files) - self.maxitems]:
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,51 @@
+import Network as nwrk
+from LRUStore import LRUStore
+
+'''
+LatticeCache memoizes lattice generation --> a generated lattice only depends on its symmetry and length, so each one is built once,
+kept in an LRUStore (in memory, plus optionally pickled to a directory) and every later request gets a copy of it.
+With the array backend the copies are copy on write (see ArrayGraph.copy), so handing one out is almost free and randomizing or
+pruning it never touches the cached lattice. networkx graphs can't share memory like that, their copy costs about as much as
+building the lattice again, so the cache mainly pays off with Network(backend='array')
+
+    cache = LatticeCache()
+    graph = nwrk.Network(backend='array')
+    graph.setCubicSymmetry(50, cache=cache)       --> the same for runPipeline: ('setCubicSymmetry', {'length': 50, 'cache': cache})
+'''
+
+
+class LatticeCache:
+
+    def __init__(self, maxitems=8, directory=None, memoryitems=None):
+        '''
+        maxitems = most lattices kept, the least recently used ones are evicted past that
+        directory = optional folder to also keep the lattices in, so they survive restarts and are shared between processes
+        memoryitems = most lattices kept in memory when a directory is used (defaults to maxitems)
+        '''
+
+        self.store = LRUStore(maxitems=maxitems, directory=directory, memoryitems=memoryitems)
+
+        self.hits = 0       # number of lattices handed out from the cache
+        self.misses = 0     # number of lattices that had to be generated
+
+    def lattice(self, method, length, backend='networkx', periodic=False):
+        '''
+        returns a new Network holding the lattice that Network.method(length, periodic=periodic) generates, copied from the cache
+        method = 'setCubicSymmetry', 'setHexagonalSymmetry' or 'setBodyCenterCubic'
+        '''
+
+        key = '{}-{}-{}{}'.format(method, length, backend, '-periodic' if periodic else '')
+        cached = self.store.get(key)
+
+        if cached is None:
+            self.misses += 1
+            cached = nwrk.Network(backend)
+            getattr(cached, method)(length, periodic=periodic)
+            self.store.put(key, cached)
+        else:
+            self.hits += 1
+
+        return cached.copy()
+
+    def clear(self):
+        self.store.clear()
@@ -1,22 +1,314 @@
+import json
 import networkx as nx
 import numpy as np
+import os
+import pickle
 import plotly.graph_objects as go
-import random
-from itertools import permutations
-from noise import snoise4
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from ArrayGraph import ArrayGraph
+from Histogram import Histogram
+from noisefield import displacementField
+from rings import edgeRings
 
 '''
 The 'Network' class contains everything I used to not only generate and randomize symmetrical lattices, but also everything needed to visualize some of the data they produce.
 Used networkx to store the networks and manipulate them easily, and Plotly/Dash to visualize data. More detailed descriptions are available within the functions
+For big lattices use Network(backend='array') --> the graph is then stored in an ArrayGraph (see ArrayGraph.py) instead of a networkx Graph, which uses far less memory
 If you have any questions don't hesitate to reach out - email is matthew.macdonald3@mail.mcgill.ca
 '''
 
 
+# methods that can be used as a stage in Network.runPipeline()
+PIPELINE_STAGES = ('setCubicSymmetry', 'setHexagonalSymmetry', 'setBodyCenterCubic', 'randomize', 'declutter',
+                   'prune', 'connectNeighbours', 'removeKinks', 'findAngles', 'findRings',
+                   'findEdgeLengths', 'findPairDistribution')
+
+
+def refinementStages(deadends=None, kinks=False):
+    '''
+    returns the list of pipeline stages that cleans up a lattice after randomize() (same order the Dash app has always used)
+    deadends = 'prune' or 'connect' --> what to do with deadends, anything else (None, 'nada') leaves them
+    kinks = True to straighten kinks with removeKinks()
+    '''
+    
+    stages = ['declutter']
+    
+    if deadends == 'prune':
+        stages.append('prune')
+    if deadends == 'connect':
+        stages.append('connectNeighbours')
+    if kinks:
+        stages.append('removeKinks')
+    if deadends == 'prune':
+        stages.append('prune')
+    if kinks:
+        stages.append('removeKinks')
+    if deadends == 'connect':
+        stages.append('connectNeighbours')
+    
+    stages.append(('declutter', {'compact': True}))
+    
+    return stages
+
+
+def formatReport(report):
+    '''
+    returns the report from Network.runPipeline() as a text table
+    '''
+    
+    lines = ['{:<29}{:>10}{:>12}{:>10}{:>9}{:>10}{:>9}'.format('stage', 'seconds', 'peak MB', 'nodes', 'change', 'edges', 'change')]
+    
+    for row in report:
+        peak = '-' if row['peakmemory'] is None else '{:.1f}'.format(row['peakmemory']/1e6)
+        stage = row['stage'] + (' (cached)' if row.get('cached') else '')
+        lines.append('{:<29}{:>10.3f}{:>12}{:>10}{:>+9}{:>10}{:>+9}'.format(stage, row['seconds'], peak, row['nodes'], 
+                                                                            row['nodechange'], row['edges'], row['edgechange']))
+    
+    return '\n'.join(lines)
+
+
+def findPairs(coords, maxrad, minrad=0, box=None, executor=None, blocks=1):
+    '''
+    Finds every pair of points whose distance d satisfies 0 < d and minrad <= d <= maxrad
+    Uses a KD-tree so only nearby points are ever compared --> roughly O(N) instead of the O(N^2) double loop
+    coords = (N, 3) array-like of xyz coordinates, index in the array is the node label
+    box = None, or the (3,) size of a periodic box the coordinates are in (0 <= x < box) --> distances are then minimum image distances
+    executor, blocks = optional concurrent.futures executor (e.g. a ProcessPoolExecutor) and number of blocks --> the points are cut into 
+                       that many slabs along their longest side and each slab (plus a halo of maxrad around it) is searched on its own 
+                       by the executor, see _blockPairs(). Gives exactly the same pairs, not used for periodic boxes
+    returns an (M, 2) integer array of pairs (i, j) with i < j, sorted so edges get added in the same order as the old double loop
+    '''
+    
+    coords = np.asarray(coords, dtype=float)
+    
+    if len(coords) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+    
+    if executor is not None and blocks > 1 and box is None:
+        axis = np.argmax(np.ptp(coords, axis=0))
+        x = coords[:, axis]
+        
+        # equal numbers of points per slab, slab k holds cuts[k-1] <= x < cuts[k]
+        cuts = np.quantile(x, np.linspace(0, 1, blocks + 1)[1:-1])
+        block = np.searchsorted(cuts, x, side='right')
+        bounds = np.concatenate(([-np.inf], cuts, [np.inf]))
+        halo = maxrad*(1 + 1e-6)
+        
+        jobs = []
+        for k in range(blocks):
+            members = np.flatnonzero((x >= bounds[k] - halo) & (x < bounds[k+1] + halo))
+            jobs.append((coords[members], members, block[members] == k, maxrad, minrad))
+        
+        pairs = np.concatenate(list(executor.map(_blockPairs, *zip(*jobs))))
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    
+    # query slightly past maxrad so pairs sitting right on the cutoff aren't lost to rounding inside the tree,
+    # then apply the exact same test the double loop used 
+    pairs = cKDTree(coords, boxsize=box).query_pairs(maxrad*(1 + 1e-9), output_type='ndarray')
+    
+    distance = np.linalg.norm(minimumImage(coords[pairs[:, 0]] - coords[pairs[:, 1]], box), axis=1)
+    pairs = pairs[(distance != 0) & (minrad <= distance) & (distance <= maxrad)]
+    
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def _blockPairs(coords, labels, owned, maxrad, minrad):
+    '''
+    one slab of findPairs(executor=...) --> finds the pairs among the slab and its halo, and keeps the ones whose first node is in the 
+    slab itself (owned), so every pair is found by exactly one slab. labels = sorted node label of each row of coords
+    '''
+    pairs = findPairs(coords, maxrad, minrad)
+    return labels[pairs[owned[pairs[:, 0]]]].reshape(-1, 2)
+
+
+def minimumImage(vectors, box):
+    '''
+    returns the shortest periodic image of each (..., 3) vector in a box of size box (the vectors unchanged if box is None)
+    '''
+    if box is None:
+        return vectors
+    return vectors - box*np.round(vectors/box)
+
+
+def _sortPairs(pairs):
+    '''
+    orders an (M, 2) array of edges so each row is (i, j) with i < j and the rows are sorted, 
+    which is the order the old distance double loop added edges in 
+    '''
+    pairs = np.sort(np.asarray(pairs, dtype=np.intp).reshape(-1, 2), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def _uniqueRows(rows):
+    '''
+    np.unique(rows, axis=0, return_index=True, return_inverse=True) for an (N, 3) integer array, with a lexsort instead of 
+    sorting the rows as raw bytes (several times faster)
+    '''
+    
+    order = np.lexsort(rows.T[::-1])
+    ordered = rows[order]
+    
+    new = np.ones(len(rows), dtype=np.bool_)
+    new[1:] = np.any(ordered[1:] != ordered[:-1], axis=1)
+    
+    inverse = np.empty(len(rows), dtype=np.intp)
+    inverse[order] = np.cumsum(new) - 1
+    
+    return ordered[new], order[new], inverse
+
+
+def lineSegments(coords, edges, box=None):
+    '''
+    returns the points of a plotly line trace that draws every edge --> (3E, 3) array, each edge is its two end points 
+    followed by a row of nan so the line breaks between edges (same as the None separators, without a Python loop)
+    box = periodic box size or None --> edges that wrap around the box are drawn to the periodic image of their second node
+    '''
+    
+    points = np.full((len(edges), 3, 3), np.nan)
+    points[:, 0] = coords[edges[:, 0]]
+    points[:, 1] = points[:, 0] + minimumImage(coords[edges[:, 1]] - points[:, 0], box)
+    
+    return points.reshape(-1, 3)
+
+
+def subsampleEdges(coords, edges, maxedges):
+    '''
+    picks at most maxedges of the edges, spread evenly through space --> the bounding box is cut into cubic cells so there are 
+    about maxedges of them and one edge is kept per cell (by its midpoint), the cells grow until few enough are left
+    returns the kept rows of edges
+    '''
+    
+    if len(edges) <= maxedges:
+        return edges
+    if maxedges <= 0:
+        return edges[:0]
+    
+    midpoints = (coords[edges[:, 0]] + coords[edges[:, 1]])/2
+    low = midpoints.min(axis=0)
+    size = np.maximum(midpoints.max(axis=0) - low, 1e-9)
+    cell = (np.prod(size)/maxedges)**(1/3)
+    
+    while True:
+        cells = np.floor((midpoints - low)/cell).astype(np.int64)
+        cells = cells[:, 0] + (cells[:, 1] + cells[:, 2]*(cells[:, 1].max() + 1))*(cells[:, 0].max() + 1)
+        first = np.sort(np.unique(cells, return_index=True)[1])
+        
+        if len(first) <= maxedges:
+            return edges[first]
+        cell *= (len(first)/maxedges)**(1/3)*1.01
+
+
+def cubicLattice(length):
+    '''
+    Generates a cubic lattice straight from index arithmetic, no distances computed
+    length = positive integer --> (length+1)^3 nodes, node label = x*(length+1)^2 + y*(length+1) + z
+    returns (coords, pairs) --> (N, 3) float array of node coordinates and (M, 2) integer array of edges
+    '''
+    
+    n = length + 1
+    x, y, z = np.meshgrid(np.arange(n), np.arange(n), np.arange(n), indexing='ij')
+    coords = np.column_stack((x.ravel(), y.ravel(), z.ravel())).astype(float)
+    
+    label = np.arange(n**3).reshape(n, n, n)
+    
+    # stencil --> every node connects to the next node along +x, +y and +z 
+    pairs = [np.column_stack((label[:-1, :, :].ravel(), label[1:, :, :].ravel())),
+             np.column_stack((label[:, :-1, :].ravel(), label[:, 1:, :].ravel())),
+             np.column_stack((label[:, :, :-1].ravel(), label[:, :, 1:].ravel()))]
+    
+    return coords, _sortPairs(np.concatenate(pairs))
+
+
+def bccLattice(length):
+    '''
+    Generates a body center cubic lattice straight from index arithmetic, no distances computed
+    length = positive integer --> every (x, y, z) in 0..length gets a corner node (label 2k) and a body center node at +0.5 (label 2k+1)
+    returns (coords, pairs) --> (N, 3) float array of node coordinates and (M, 2) integer array of edges
+    '''
+    
+    n = length + 1
+    x, y, z = np.meshgrid(np.arange(n), np.arange(n), np.arange(n), indexing='ij')
+    corners = np.column_stack((x.ravel(), y.ravel(), z.ravel())).astype(float)
+    
+    coords = np.empty((2*len(corners), 3))
+    coords[0::2] = corners
+    coords[1::2] = corners + 0.5
+    
+    corner = 2*np.arange(n**3).reshape(n, n, n)
+    center = corner + 1
+    
+    # corners form a cubic lattice, so do the centers (both with edge length 1)
+    pairs = []
+    for label in (corner, center):
+        pairs.extend([np.column_stack((label[:-1, :, :].ravel(), label[1:, :, :].ravel())),
+                      np.column_stack((label[:, :-1, :].ravel(), label[:, 1:, :].ravel())),
+                      np.column_stack((label[:, :, :-1].ravel(), label[:, :, 1:].ravel()))])
+    
+    # each corner connects to the 8 surrounding centers, i.e. the centers of the cells at (x-dx, y-dy, z-dz) with dx, dy, dz in {0, 1}
+    for dx in (0, 1):
+        for dy in (0, 1):
+            for dz in (0, 1):
+                pairs.append(np.column_stack((corner[dx:, dy:, dz:].ravel(), center[:n-dx, :n-dy, :n-dz].ravel())))
+    
+    return coords, _sortPairs(np.concatenate(pairs))
+
+
+def hexagonalLattice(length):
+    '''
+    Generates a hexagonal lattice straight from index arithmetic, no distances computed
+    length = positive integer --> same nodes (and node labels) as the old x/y/z loop: layers along z, rows along y,
+    and in each row a pair of nodes at x and x+sqrt(2) for x = 0, 4, 8... (even rows) or x = 2, 6, 10... (odd rows) below length
+    returns (coords, pairs) --> (N, 3) float array of node coordinates and (M, 2) integer array of edges
+    '''
+    
+    sites = [len(range(0, length, 4)), len(range(2, length, 4))]   # pairs of nodes in an even/odd row
+    maxsites = max(sites)
+    
+    # label[z, y, m, s] = label of node s (0 at x, 1 at x+sqrt(2)) of the m-th pair in row y of layer z, -1 if that pair doesn't exist
+    exists = np.zeros((length, length, maxsites, 2), dtype=bool)
+    for y in range(length):
+        exists[:, y, :sites[y%2], :] = True
+    
+    label = np.full(exists.shape, -1, dtype=np.intp)
+    label[exists] = np.arange(np.count_nonzero(exists))
+    
+    z, y, m, s = np.nonzero(exists)
+    x = 4*m + 2*(y%2) + s*np.sqrt(2)
+    coords = np.column_stack((x, y, z)).astype(float)
+    
+    def link(a, b):
+        keep = (a != -1) & (b != -1)
+        return np.column_stack((a[keep], b[keep]))
+    
+    # stencil --> each pair is joined, every node joins the same node in the next layer, 
+    # and rows y and y+1 are joined by the two nodes 2-sqrt(2) apart in x 
+    pairs = [link(label[..., 0], label[..., 1]),
+             link(label[:-1], label[1:])]
+    
+    for y in range(length - 1):
+        even, odd = (y, y+1) if y%2 == 0 else (y+1, y)
+        pairs.append(link(label[:, even, :, 1], label[:, odd, :, 0]))          # x+sqrt(2) in the even row to x+2 in the odd row
+        pairs.append(link(label[:, even, 1:, 0], label[:, odd, :-1, 1]))      # x in the even row to x-2+sqrt(2) in the odd row
+    
+    return coords, _sortPairs(np.concatenate(pairs))
+
+
 class Network:
 
-    def __init__(self):    #
+    def __init__(self, backend='networkx'):    # backend = 'networkx' or 'array'
+        
+        if backend not in ('networkx', 'array'):
+            raise ValueError("backend must be 'networkx' or 'array', got {}".format(backend))
+        
+        self.backend = backend
         
-        self.G = nx.Graph()     # New networkx graph object 
+        self.G = self._newGraph()     # New networkx graph object (or ArrayGraph for the array backend)
         
         self.symmetry = None    # Can be cubic/bcc/hexagonal/randomized 
         
@@ -25,200 +317,457 @@ class Network:
         self.nodezvals = None   # -> for  example, node with label '1''s x coordinate is stored at self.nodexvals[1]
         
         self.unitcell = None    # unit cell size for each symmetrical lattices
+        self.box = None         # (3,) size of the periodic box for lattices made with periodic=True, None for a finite lattice
         self.angles = None      # list of angles between edges --> have to run findAngles method to have something stored there
+        self.anglehist = None   # Histogram of the angles, only filled by findAngles(accumulate=True)
+        self.degreehist = None  # Histogram of the node valence, filled by plotDegree
+        self.edgerings = None   # shortest ring size through every edge (same order as self._edges()), 0 = none found --> filled by findRings
+        self.noderings = None   # shortest ring size through every node label, 0 = none found (or removed node)
+        self.ringhist = None    # Histogram of self.noderings, bin k = rings of k edges
+        self.lengthhist = None  # Histogram of the edge lengths, filled by findEdgeLengths
+        self.pairdist = None    # (r, g(r)) arrays of the pair distribution function, filled by findPairDistribution
         
         self.degreefig = None   # the plotly figure object --> for ex. do self.degreefig.show() if you want it displayed
         self.anglefig = None    # same as above 
+        self.ringfig = None     # same as above
+        self.lengthfig = None   # same as above
+        self.pairfig = None     # same as above
         
         self.fig = None         # plotly figure of the entire lattice w/ nodes and edges
-
-    def setHexagonalSymmetry(self, length): 
         
+        self.report = None      # timing/memory/size of each stage of the last runPipeline() call
+        self._progress = None   # set by runPipeline(progress=...) while a stage runs, see _step()
+
+    def __getstate__(self):
         '''
-        sets Network object to hexagonal symmetry
-        length = positive integer
+        what gets pickled (e.g. by the Dash app's session store) --> the plotly figures are left out since they can be rebuilt
+        and are usually bigger than the lattice, and with the array backend the coordinate views are rebuilt on load
         '''
+        state = self.__dict__.copy()
+        state['fig'] = state['degreefig'] = state['anglefig'] = state['ringfig'] = state['lengthfig'] = state['pairfig'] = None
+        state['_progress'] = None
+        if self.backend == 'array':
+            state['nodexvals'] = state['nodeyvals'] = state['nodezvals'] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('box', None)     # pickled before periodic lattices existed
+        for name in ('edgerings', 'noderings', 'ringhist', 'ringfig', 'lengthhist', 'pairdist', 'lengthfig', 'pairfig', '_progress'):
+            state.setdefault(name, None)
+        self.__dict__.update(state)
+        if self.backend == 'array' and self.G.number_of_nodes() != 0:
+            self.nodexvals, self.nodeyvals, self.nodezvals = self.G.coords.T
+
+    def _newGraph(self):
+        '''
+        returns an empty graph object for the backend this Network uses
+        '''
+        if self.backend == 'array':
+            return ArrayGraph()
+        return nx.Graph()
+    
+    def _build(self, coords, pairs):
+        '''
+        (re)builds self.G and the coordinate lists from an (N, 3) array of node coordinates and an (M, 2) array of edges
+        with the array backend nodexvals/nodeyvals/nodezvals are views into the graph's (N, 3) coordinate array, so there is only one copy of the positions
+        '''
+        if self.backend == 'array':
+            self.G = ArrayGraph(coords, pairs)
+            self.nodexvals, self.nodeyvals, self.nodezvals = self.G.coords.T
+            return
         
         self.G.clear()
         
-        xvals = []
-        yvals = []
-        zvals = []
-        
-        for z in range(length):
-            for y in range(length):
-                for x in range(length):
-                    if y%2 == 0:
-                        if x%4 == 0:
-                            xvals.append(x)
-                            yvals.append(y)
-                            zvals.append(z)
-                            
-                            xvals.append(x+np.sqrt(2))
-                            yvals.append(y)
-                            zvals.append(z)
-                        
-                    if y%2 != 0:
-                        if x%4 != 0 and x%2 == 0:
-                            xvals.append(x)
-                            yvals.append(y)
-                            zvals.append(z)
-                            
-                            xvals.append(x+np.sqrt(2))
-                            yvals.append(y)
-                            zvals.append(z)
+        for i, pos in enumerate(np.asarray(coords, dtype=float).tolist()):
+            self.G.add_node(i, pos=pos)
         
-                        
-        for i in range(len(xvals)):
-            self.G.add_node(i, pos=[xvals[i], yvals[i], zvals[i]])
+        self.G.add_edges_from(np.asarray(pairs).tolist())
         
-        for i in range(len(self.G.nodes)):
-            for j in range(len(self.G.nodes)):
-                
-                node1 = np.array(self.G.nodes[i]['pos'])
-                node2 = np.array(self.G.nodes[j]['pos'])
-                
-                distance = np.linalg.norm(node1-node2)
-                
-                if distance != 0 and distance <= (np.sqrt(2) + 0.2):
-                    if not (node1[0] != node2[0] and node1[2] != node2[2]):
-                        self.G.add_edge(i, j)
+        self.nodexvals, self.nodeyvals, self.nodezvals = np.asarray(coords, dtype=float).T.tolist()
+    
+    def _positions(self):
+        '''
+        returns the node coordinates as an (N, 3) float array, row index = node label, removed nodes are nan
+        '''
+        if self.backend == 'array':
+            return self.G.coords
+        if self.nodexvals is None:
+            return np.empty((0, 3))     # no lattice set yet
+        return np.array((self.nodexvals, self.nodeyvals, self.nodezvals), dtype=float).T
+    
+    def _alive(self):
+        '''
+        returns a boolean array, True for every node label that is still in the graph
+        '''
+        if self.backend == 'array':
+            return self.G.alive.copy()
         
-        self.symmetry = "Hexagonal"
+        alive = np.zeros(0 if self.nodexvals is None else len(self.nodexvals), dtype=bool)
+        alive[list(self.G.nodes)] = True
+        return alive
+    
+    def _edges(self):
+        '''
+        returns every edge as an (E, 2) integer array of node labels
+        '''
+        if self.backend == 'array':
+            return self.G.edge_array()
+        return np.array(list(self.G.edges()), dtype=np.intp).reshape(-1, 2)
+    
+    def _adjacency(self):
+        '''
+        returns the adjacency matrix as an (N, N) scipy CSR matrix, row/column index = node label, removed nodes have empty rows
+        '''
+        if self.backend == 'array':
+            return self.G.adjacency_matrix()
         
-        self.nodexvals = xvals
-        self.nodeyvals = yvals
-        self.nodezvals = zvals  
+        n = 0 if self.nodexvals is None else len(self.nodexvals)
+        edges = self._edges()
+        rows = np.concatenate((edges[:, 0], edges[:, 1]))
+        cols = np.concatenate((edges[:, 1], edges[:, 0]))
+        
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    
+    def copy(self):
+        '''
+        returns a new Network with the same lattice (the figures, angles and histograms aren't copied)
+        with the array backend the copy shares the graph's arrays until either one changes them (copy on write), so it is almost free
+        '''
+        new = Network(self.backend)
+        new.symmetry = self.symmetry
+        new.unitcell = self.unitcell
+        new.box = self.box
+        
+        if self.backend == 'array':
+            new.G = self.G.copy(shared=True)
+            new.nodexvals, new.nodeyvals, new.nodezvals = new.G.coords.T
+            return new
+        
+        # a pickle round trip copies a networkx Graph faster than G.copy() does
+        new.G = pickle.loads(pickle.dumps(self.G, protocol=pickle.HIGHEST_PROTOCOL))
+        new.nodexvals, new.nodeyvals, new.nodezvals = list(self.nodexvals), list(self.nodeyvals), list(self.nodezvals)
+        return new
+    
+    def _restore(self, other):
+        '''
+        takes over the lattice of another Network (e.g. a copy handed out by a LatticeCache)
+        '''
+        self.G = other.G
+        self.nodexvals, self.nodeyvals, self.nodezvals = other.nodexvals, other.nodeyvals, other.nodezvals
+        self.symmetry = other.symmetry
+        self.unitcell = other.unitcell
+        self.box = other.box
+    
+    def toNetworkx(self):
+        '''
+        returns a networkx Graph copy of the lattice (nodes have a 'pos' attribute), whichever backend is used
+        '''
+        if self.backend == 'array':
+            return self.G.to_networkx()
+        return self.G.copy()
+
+    def save(self, path, compress=False):
+        '''
+        Saves the lattice (coordinates, adjacency, symmetry, unitcell and angles if they were found) in a binary format
+        path = file ending in .npz --> one numpy archive (compress=True to zip it, smaller but slower and can't be memory mapped)
+               anything else --> a directory of raw .npy arrays plus network.json, which load() can memory map
+        '''
+        
+        adjacency = self._adjacency()
+        adjacency.sort_indices()
+        
+        arrays = {'coords': np.asarray(self._positions(), dtype=float).reshape(-1, 3), 'alive': self._alive(),
+                  'deg': np.diff(adjacency.indptr).astype(np.int32), 'indptr': adjacency.indptr.astype(np.int64), 
+                  'indices': adjacency.indices.astype(np.int32)}
+        if self.angles is not None:
+            arrays['angles'] = np.asarray(self.angles, dtype=float)
+        
+        meta = {'format': 1, 'backend': self.backend, 'symmetry': self.symmetry, 
+                'unitcell': None if self.unitcell is None else float(self.unitcell),
+                'box': None if self.box is None else np.asarray(self.box, dtype=float).tolist()}
+        
+        if path.endswith('.npz'):
+            (np.savez_compressed if compress else np.savez)(path, meta=np.array(json.dumps(meta)), **arrays)
+            return
+        
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+        if self.angles is None and os.path.exists(os.path.join(path, 'angles.npy')):
+            os.remove(os.path.join(path, 'angles.npy'))
+        with open(os.path.join(path, 'network.json'), 'w') as f:
+            json.dump(meta, f)
+    
+    @classmethod
+    def load(cls, path, backend=None, mmap=False):
+        '''
+        Returns a new Network with a lattice written by save()
+        backend = 'networkx' or 'array', None for the one it was saved from
+        mmap = True to memory map the arrays of a saved directory instead of reading them (array backend only) --> opens instantly whatever 
+               the size and pages the data in as it is used. The mapped arrays are read only, the first change to a node or edge copies them 
+               into memory (like ArrayGraph.copy(shared=True))
+        '''
+        
+        if path.endswith('.npz'):
+            if mmap:
+                raise ValueError("only a directory saved by save() can be memory mapped, not an .npz file")
+            with np.load(path) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+            meta = json.loads(str(arrays.pop('meta')))
+        else:
+            with open(os.path.join(path, 'network.json')) as f:
+                meta = json.load(f)
+            arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None) 
+                      for name in os.listdir(path) if name.endswith('.npy')}
+        
+        network = cls(meta['backend'] if backend is None else backend)
+        
+        if mmap and network.backend != 'array':
+            raise ValueError("mmap=True needs the array backend")
+        
+        if network.backend == 'array':
+            G = ArrayGraph()
+            G.coords, G.alive, G.deg, G.indptr, G.indices = (arrays[name] for name in ('coords', 'alive', 'deg', 'indptr', 'indices'))
+            G._shared = mmap
+            network.G = G
+            network.nodexvals, network.nodeyvals, network.nodezvals = G.coords.T
+        else:
+            indptr, indices = arrays['indptr'], arrays['indices']
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            edges = np.column_stack((rows, indices))[rows < indices]
+            
+            network._build(arrays['coords'], edges)
+            
+            removed = np.flatnonzero(~arrays['alive'])
+            network.G.remove_nodes_from(removed.tolist())
+            network._forget(removed)
+        
+        network.symmetry = meta['symmetry']
+        network.unitcell = meta['unitcell']
+        network.box = None if meta.get('box') is None else np.array(meta['box'])
+        network.angles = arrays.get('angles')
+        
+        return network
+    
+    def setHexagonalSymmetry(self, length, cache=None, periodic=False): 
+        
+        '''
+        sets Network object to hexagonal symmetry
+        length = positive integer
+        cache = optional LatticeCache (see LatticeCache.py) --> the lattice is only generated once per length and then copied from it
+        periodic = True --> the lattice fills a periodic box of size length (a multiple of 4) instead of having surfaces, see _setPeriodic()
+        '''
+        
+        if cache is not None:
+            self._restore(cache.lattice('setHexagonalSymmetry', length, self.backend, periodic))
+            return self.G
+        
+        if periodic:
+            if length%4 != 0:
+                raise ValueError("a periodic hexagonal lattice needs a length that is a multiple of 4, got {}".format(length))
+            self._setPeriodic(hexagonalLattice(length)[0], (length, length, length), 1.45)
+        else:
+            coords, pairs = hexagonalLattice(length)
+            self._build(coords, pairs)
+            self.box = None
+        
+        self.symmetry = "Hexagonal"
         
         self.unitcell = np.sqrt(2)
         
         return self.G
     
-    def setCubicSymmetry(self, length):
+    def setCubicSymmetry(self, length, cache=None, periodic=False):
         '''
         sets Network object to cubic symmetry
         length = positive integer
+        cache = optional LatticeCache, same as for setHexagonalSymmetry
+        periodic = True --> length^3 unit cells in a periodic box (length at least 3) instead of a lattice with surfaces
         '''        
-        self.G.clear()
-        
-        xvals = []
-        yvals = []
-        zvals = []
-        
-        for x in range(0, length+1):
-            for y in range(0, length+1):
-                for z in range(0, length+1):
-                    xvals.append(x)
-                    yvals.append(y)
-                    zvals.append(z)    
+        if cache is not None:
+            self._restore(cache.lattice('setCubicSymmetry', length, self.backend, periodic))
+            return self.G
         
-        for i in range(len(xvals)):
-            self.G.add_node(i, pos=[xvals[i], yvals[i], zvals[i]])
-                    
-        for i in range(len(self.G.nodes)):
-            for j in range(len(self.G.nodes)):
-                
-                node1 = np.array(self.G.nodes[i]['pos'])
-                node2 = np.array(self.G.nodes[j]['pos'])
-                
-                distance = np.linalg.norm(node1-node2)
-                
-                if distance != 0 and distance <= 1:
-                    self.G.add_edge(i, j)
+        if periodic:
+            self._setPeriodic(cubicLattice(length - 1)[0], (length, length, length), 1)
+        else:
+            coords, pairs = cubicLattice(length)
+            self._build(coords, pairs)
+            self.box = None
         
         self.symmetry = "Cubic"
         
-        self.nodexvals = xvals
-        self.nodeyvals = yvals
-        self.nodezvals = zvals
-        
         self.unitcell = 1 
         
         return self.G
         
-    def setBodyCenterCubic(self, length):
+    def setBodyCenterCubic(self, length, cache=None, periodic=False):
         '''
         sets Network object to BCC symmetry
         length = positive integer
+        cache = optional LatticeCache, same as for setHexagonalSymmetry
+        periodic = True --> length^3 unit cells in a periodic box (length at least 3) instead of a lattice with surfaces
         '''        
+        if cache is not None:
+            self._restore(cache.lattice('setBodyCenterCubic', length, self.backend, periodic))
+            return self.G
         
-        self.G.clear()
+        if periodic:
+            self._setPeriodic(bccLattice(length - 1)[0], (length, length, length), 1)
+        else:
+            coords, pairs = bccLattice(length)
+            self._build(coords, pairs)
+            self.box = None
         
-        xvals = []
-        yvals = []
-        zvals = []
+        self.symmetry = "BCC"
         
-        for x in range(0, length+1):
-            for y in range(0, length+1):
-                for z in range(0, length+1):
-                    xvals.append(x)
-                    yvals.append(y)
-                    zvals.append(z)
-                    
-                    xvals.append(x+0.5)
-                    yvals.append(y+0.5)
-                    zvals.append(z+0.5)
+        self.unitcell = 1 
+        
+        return self.G
     
-        for i in range(len(xvals)):
-            self.G.add_node(i, pos=[xvals[i], yvals[i], zvals[i]])
+    def _setPeriodic(self, coords, box, maxrad):
+        '''
+        builds a periodic lattice --> coords are the nodes of one period of the lattice (the unit cell repeated to fill the box), and every
+        pair of nodes within maxrad of each other across the periodic boundaries is joined, so there are no surfaces and every node has 
+        its bulk valence. Every node and edge of the box is stored (not just a unit cell plus repeat counts): randomize and the clean up
+        stages move and remove single nodes, so they need the explicit arrays anyway, and the box only has to be a bit over 2*maxrad wide.
+        Tiling the box into a bigger finite lattice only happens when asked for, see expandPeriodic()
+        '''
         
-        for i in range(len(self.G.nodes)):
-            for j in range(len(self.G.nodes)):
-                
-                node1 = np.array(self.G.nodes[i]['pos'])
-                node2 = np.array(self.G.nodes[j]['pos'])
-                
-                distance = np.linalg.norm(node1-node2)
-                
-                if distance != 0 and distance <= 1:
-                    self.G.add_edge(i, j)
+        box = np.asarray(box, dtype=float)
+        if np.any(box <= 2*maxrad):
+            raise ValueError("the periodic box {} is too small, every side must be more than {}".format(box.tolist(), 2*maxrad))
         
-        self.symmetry = "BCC"
+        self._build(coords, findPairs(coords, maxrad, box=box))
+        self.box = box
+    
+    def expandPeriodic(self, repeats=(1, 1, 1)):
+        '''
+        returns a new (finite) Network with the periodic lattice tiled repeats[0] x repeats[1] x repeats[2] times --> edges that wrap around 
+        the box join neighbouring copies, the ones that would leave the tiled block are dropped. Node i of copy c gets label c*N + i
+        '''
         
-        self.nodexvals = xvals
-        self.nodeyvals = yvals
-        self.nodezvals = zvals   
+        if self.box is None:
+            raise ValueError("expandPeriodic() only works on a lattice made with periodic=True")
         
-        self.unitcell = 1 
+        coords = self._positions()
+        edges = self._edges()
+        n = len(coords)
+        repeats = np.asarray(repeats, dtype=np.intp)
         
-        return self.G
+        # which periodic image of its second node each edge goes to
+        image = np.round((coords[edges[:, 1]] - coords[edges[:, 0]] - minimumImage(coords[edges[:, 1]] - coords[edges[:, 0]], self.box))/self.box).astype(np.intp)
+        
+        copies = np.stack(np.meshgrid(*(np.arange(r) for r in repeats), indexing='ij'), axis=-1).reshape(-1, 3)
+        copyindex = lambda c: (c[..., 0]*repeats[1] + c[..., 1])*repeats[2] + c[..., 2]
+        
+        newcoords = (coords[None, :, :] + copies[:, None, :]*self.box).reshape(-1, 3)
+        
+        target = copies[:, None, :] - image[None, :, :]
+        inside = np.all((target >= 0) & (target < repeats), axis=-1)
+        u = copyindex(copies)[:, None]*n + edges[None, :, 0]
+        v = copyindex(target)*n + edges[None, :, 1]
+        
+        new = Network(self.backend)
+        new._build(newcoords, _sortPairs(np.column_stack((u[inside], v[inside]))))
+        
+        removed = np.flatnonzero(~np.tile(self._alive(), len(copies)))
+        new.G.remove_nodes_from(removed.tolist())
+        new._forget(removed)
+        
+        new.symmetry = self.symmetry
+        new.unitcell = self.unitcell
+        
+        return new
     
-    def visualizeGraph(self, bool):
+    def readCSV(self, path, scale=15, tolerance=1e-6, chunksize=500000, header=0):
         '''
-        Creates a plotly figure to visualize the lattice. if bool=True then the plot is 
-        displayed, else the plot is just stored in self.fig
+        Builds the Network from a CSV of strut segments (e.g. a micro-CT export), one segment per row: x1, y1, z1, x2, y2, z2 in the first 6 columns
+        Endpoints shared by several segments become one node --> each endpoint is rounded to a grid of spacing tolerance and points with the same 
+        grid coordinates are merged, so the struts come back as one connected graph. The file is read chunksize rows at a time
+        path = file name (or anything pandas.read_csv accepts)
+        scale = coordinates are moved/scaled so the smallest value is 0 and the biggest is scale (same for x, y and z, like the old buildgraph.py)
+        tolerance = endpoints closer than this (in the file's units, per coordinate) are treated as the same node
+        header = row number of the column names, None if the file has none
         '''
+        import pandas as pd
         
-        x = self.nodexvals
-        y = self.nodeyvals
-        z = self.nodezvals
-   
-        nodeTrace = go.Scatter3d(
-                x=x,
-                y=y, 
-                z=z, 
-                mode = 'markers', 
-                marker = dict(size=3))
+        points = []     # unique endpoints of each chunk
+        keys = []       # their grid coordinates
+        segments = []   # each segment as (endpoint, endpoint) indices into the chunk's unique endpoints, offset by the endpoints before it
+        total = 0
         
+        for chunk in pd.read_csv(path, header=header, usecols=range(6), chunksize=chunksize):
+            ends = chunk.to_numpy(dtype=float).reshape(-1, 3)       # rows 2k and 2k+1 are the two ends of segment k
+            
+            grid = np.round(ends/tolerance).astype(np.int64)
+            grid, first, inverse = _uniqueRows(grid)
+            
+            points.append(ends[first])
+            keys.append(grid)
+            segments.append(inverse.reshape(-1, 2) + total)
+            total += len(grid)
+        
+        if total == 0:
+            self._build(np.empty((0, 3)), np.empty((0, 2), dtype=np.intp))
+        else:
+            # endpoints shared between chunks --> merge them the same way, over the (much smaller) per chunk unique endpoints
+            keys, first, inverse = _uniqueRows(np.concatenate(keys))
+            coords = np.concatenate(points)[first]
+            pairs = inverse[np.concatenate(segments)]
             
-        x_lines = list()
-        y_lines = list()
-        z_lines = list()
+            # zero length segments and struts listed twice are dropped
+            pairs = np.unique(np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1), axis=0)
+            
+            low, high = coords.min(), coords.max()
+            coords = (coords - low)/(high - low)*scale if high != low else coords - low
+            
+            self._build(coords, pairs)
+        
+        self.symmetry = "Imported"
+        self.box = None
         
+        # no lattice constant here, randomize() shifts by a typical strut length instead
+        lengths = np.linalg.norm(coords[pairs[:, 0]] - coords[pairs[:, 1]], axis=1) if total != 0 else []
+        self.unitcell = float(np.median(lengths)) if len(lengths) != 0 else 1
         
-        edge_list = list(self.G.edges())
+        return self.G
+    
+    def visualizeGraph(self, bool, maxedges=None, region=None):
+        '''
+        Creates a plotly figure to visualize the lattice. if bool=True then the plot is 
+        displayed, else the plot is just stored in self.fig
+        maxedges = None to draw every edge, or the most edges to send to the plot --> past that a spatially even subsample is drawn 
+                   (one edge per grid cell, see subsampleEdges()), the lattice itself is never changed
+        region = None or ((xmin, ymin, zmin), (xmax, ymax, zmax)) --> only the nodes and edges inside that box are drawn
+        '''
         
+        coords = self._positions()
+        alive = self._alive()
+        edges = self._edges()
+        total = len(edges)
         
-        for pairs in edge_list:
-            for i in range(2):
-                x_lines.append(self.nodexvals[pairs[i]])
-                y_lines.append(self.nodeyvals[pairs[i]])
-                z_lines.append(self.nodezvals[pairs[i]])
-            x_lines.append(None)
-            y_lines.append(None)
-            z_lines.append(None)
-                
+        if region is not None:
+            low, high = np.asarray(region, dtype=float)
+            alive &= np.all((coords >= low) & (coords <= high), axis=1)
+            edges = edges[alive[edges].all(axis=1)]
+        
+        if maxedges is not None and len(edges) > maxedges:
+            edges = subsampleEdges(coords, edges, maxedges)
+            
+            # only draw the nodes of the edges that are left, otherwise the nodes alone would swamp the plot
+            shown = np.zeros_like(alive)
+            shown[edges.ravel()] = True
+            alive &= shown
+        
+        nodeTrace = go.Scatter3d(
+                x=coords[alive, 0],
+                y=coords[alive, 1], 
+                z=coords[alive, 2], 
+                mode = 'markers', 
+                marker = dict(size=3))
         
+        x_lines, y_lines, z_lines = lineSegments(coords, edges, box=self.box).T
         
         edgeTrace = go.Scatter3d(
             x=x_lines,
@@ -228,132 +777,120 @@ class Network:
         
         fig = go.Figure(data=[nodeTrace, edgeTrace])
         
+        if len(edges) != total:
+            fig.update_layout(title={'text': 'Showing {} of {} edges'.format(len(edges), total), 'xanchor': 'center', 'yanchor': 'top'}, title_x=0.5)
+        
         self.fig = fig
         
         if bool == True:
             fig.show()    
         
         
-    def randomize(self, chaosmult, minrad, maxrad):
+    def randomize(self, chaosmult, minrad, maxrad, seed=None, workers=1, processes=None):
         '''
         Randomizes a lattice. Call this on a Network object that has already had a symmetry set.
         chaosmult = float between 0 and 1.0, weights the randomization
         minrad = any positive number --> sets the minimum radius for reconnection after all the nodes have been randomized
         maxrad = any positive number --> sets the maximum radius for reconnection after all the nodes have been randomized
+        seed = int (or None for a different result every time) --> the same seed on the same lattice always gives the same result
+        workers = number of threads the neighbourhoods are randomized on, gives the same result for any number of workers
+        processes = None, or a number of worker processes --> the randomization is split into groups of neighbourhoods and the reconnection 
+                    into spatial slabs with halos (see findPairs) that run on a process pool, each process only gets its own piece of the 
+                    lattice. Gives exactly the same lattice as running it in this process with the same seed
+        nodes removed earlier (by prune, removeKinks, declutter...) stay removed and keep their labels
         '''
         
-        def getRandVector(coords):
-            '''
-            Generates a random vector implementing Perlin Noise
-            
-            coords = list of length 3, [x, y, z] 
-            '''
-            #Gets a randomization vector with perlin noise implemented 
-            noisevalues = [abs(snoise4(coords[0], coords[1], coords[2], random.random())), abs(snoise4(coords[0], coords[1], coords[2], random.random())), abs(snoise4(coords[0], coords[1], coords[2], random.random())), abs(snoise4(coords[0], coords[1], coords[2], random.random()))]
-            
-            #We use noise4 so that we can seed the shift with a random variable (random.random())
-            
-            randvector = [np.sqrt(-2*np.log(noisevalues[0]))*np.cos(2*np.pi*noisevalues[1]), noisevalues[2], np.arccos(1-2*noisevalues[3])]
-            
-            
-            
-            return randvector        
-        
+        # the randomization of each node is dependent on the randomization of all other nodes to 2 degrees 
+        # --> row i of twohop holds every 1st and 2nd degree neighbour of node i
+        adjacency = self._adjacency()
+        twohop = (adjacency + adjacency @ adjacency).tocsr()
+        twohop.sort_indices()
         
-        neighbours = {}  # neighbors stores all the 2nd degree neighbours of each node --> the randomization of each node is dependent on the randomization of all other nodes to 2 degrees. 
-        
-        for i in range(len(self.nodexvals)):
-            temp = [n for n in self.G.neighbors(i)]
-            iterneigh = [n for n in self.G.neighbors(i)]
-            for j in iterneigh:
-                temp2 = [n for n in self.G.neighbors(j)]
-                for vals in temp2:
-                    temp.append(vals)
-            neighbours[i] = temp
-
-         
+        # order the nodes get randomized in --> a node, then all of its 2nd degree neighbours that haven't been randomized yet
+        # (removed nodes are skipped, they have no neighbours and their coordinates stay nan)
+        alive = self._alive()
+        visited = np.zeros(twohop.shape[0], dtype=bool)
         randnodes = []
+        
+        for j in np.flatnonzero(alive).tolist():
+            if visited[j]:
+                continue
             
-        for j in range(len(neighbours.keys())):
-            
-            if j not in randnodes:
-                
-                nnodes = []
-                
-                for n in neighbours[j]:
-                    nnodes.append(n)
-                
-                coords = [self.nodexvals[j], self.nodeyvals[j], self.nodezvals[j]]
-                
-                shift = getRandVector(coords=coords)
-                
-                self.nodexvals[j] = self.nodexvals[j]+shift[0]*chaosmult*self.unitcell
-                self.nodeyvals[j] = self.nodeyvals[j]+shift[1]*chaosmult*self.unitcell
-                self.nodezvals[j] = self.nodezvals[j]+shift[2]*chaosmult*self.unitcell
-                
-                randnodes.append(j)
-            else:
-                pass
+            neighbourhood = twohop.indices[twohop.indptr[j]:twohop.indptr[j+1]]
+            neighbourhood = neighbourhood[~visited[neighbourhood] & (neighbourhood != j)]
             
-            for k in nnodes:
-                if k in randnodes:
-                    continue
-                else: 
-                    coords = [self.nodexvals[k], self.nodeyvals[k], self.nodezvals[k]]
-                    
-                    shift1 = getRandVector(coords=coords)
-                    
-                    self.nodexvals[k] = self.nodexvals[k]+shift1[0]*chaosmult*self.unitcell
-                    self.nodeyvals[k] = self.nodeyvals[k]+shift1[1]*chaosmult*self.unitcell
-                    self.nodezvals[k] = self.nodezvals[k]+shift1[2]*chaosmult*self.unitcell 
-                    
-                    randnodes.append(k)
-                    
+            visited[j] = True
+            visited[neighbourhood] = True
+            randnodes.append(np.concatenate(([j], neighbourhood)))
+        
+        # every node is only shifted once, based on its original position, so all the shifts can be generated in one batch
+        # (see noisefield.py) --> the random numbers are handed out in the order above, and with workers > 1 the 
+        # neighbourhoods are split into groups that are randomized at the same time
+        splits = np.cumsum([len(n) for n in randnodes])[:-1]
+        randnodes = np.concatenate(randnodes) if len(randnodes) != 0 else np.empty(0, dtype=np.intp)
+        
+        coords = self._positions()
+        shift = np.zeros_like(coords)
+        live = np.flatnonzero(alive)
+        
+        # only the nodes still in the lattice are reconnected, the pairs are mapped back to their labels
+        if processes is None:
+            shift[randnodes] = displacementField(coords[randnodes], seed=seed, workers=workers, splits=splits)
+            coords = self._moved(coords, shift, chaosmult)
+            self._step('reconnection')
+            pairs = live[findPairs(coords[live], maxrad=maxrad, minrad=minrad, box=self.box)]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                shift[randnodes] = displacementField(coords[randnodes], seed=seed, workers=processes, splits=splits, executor=pool)
+                coords = self._moved(coords, shift, chaosmult)
+                self._step('reconnection')
+                pairs = live[findPairs(coords[live], maxrad=maxrad, minrad=minrad, box=self.box, executor=pool, blocks=4*processes)]
+        
+        self._build(coords, pairs)
+        
+        removed = np.flatnonzero(~alive)
+        if len(removed) != 0:
+            self.G.remove_nodes_from(removed.tolist())
+            self._forget(removed)
+    
+        self.symmetry = "Randomized"        
         
-        self.G.clear()
         
-        for j in range(len(self.nodexvals)):
-            self.G.add_node(j, pos=[self.nodexvals[j], self.nodeyvals[j], self.nodezvals[j]])
-    
-        for i in range(len(self.G.nodes)):
-            for j in range(len(self.G.nodes)):
-    
-                node1 = np.array(self.G.nodes[i]['pos'])
-                node2 = np.array(self.G.nodes[j]['pos'])
-    
-                distance = np.linalg.norm(node1-node2)
-    
-                if distance != 0 and minrad <= distance <= maxrad:
-                    self.G.add_edge(i, j)
+    def _step(self, step):
+        '''
+        tells the progress callback of runPipeline() (if there is one) that the running stage got to step, e.g. 'reconnection'
+        '''
+        if self._progress is not None:
+            self._progress(step)
     
-        self.symmetry = "Randomized"        
+    def _moved(self, coords, shift, chaosmult):
+        '''
+        returns the node coordinates after randomize() shifts them
+        '''
+        coords = coords + shift*chaosmult*self.unitcell
         
+        if self.box is not None:
+            coords = coords % self.box      # nodes that moved out of a periodic box come back in on the other side
         
+        return coords
+    
     def plotDegree(self, bool):
         '''
         plots the node valence 
         bool = True or False --> if True, figure is displayed, else it is just stored in self.degreefig
+        the counts (and mean/std of the valence) are kept in self.degreehist
         '''
 
         
-        degrees = [val for (node, val) in self.G.degree()]
+        degrees = np.array([val for (node, val) in self.G.degree()], dtype=np.int64)
         
-        degrees.sort()
+        # one bin per valence, 0 to the highest valence
+        maxdegree = degrees.max() if len(degrees) != 0 else 0
+        self.degreehist = Histogram(0, maxdegree + 1, maxdegree + 1)
+        self.degreehist.add(degrees)
         
-        frequency = {}
-        
-        for num in degrees:
-            if(num in frequency):
-                frequency[num] += 1
-            else:
-                frequency[num] = 1
-                
-        xvals = list(range(degrees[-1]+1))
-        
-        yvals = [0]*(degrees[-1]+1)
-        
-        for key in frequency:
-            yvals[key] = frequency[key]
+        xvals = list(range(maxdegree+1))
+        yvals = self.degreehist.counts
         
         fig = go.Figure([go.Bar(x=xvals, y=yvals)])
         fig.update_xaxes(title_text = 'Node Valence')
@@ -364,71 +901,127 @@ class Network:
         if bool == True:
             fig.show()
           
-    def declutter(self):
+    def declutter(self, compact=False):
         '''
-        Gets rid of all isolated nodes
+        Gets rid of all isolated nodes, and everything that isn't part of the biggest connected piece of the lattice
+        compact = True --> the remaining nodes are also relabelled 0..N-1 so the coordinate lists shrink instead of filling up with None
         '''
-                
-        self.G.remove_nodes_from(list(nx.isolates(self.G)))
         
-        components = list(nx.connected_components(self.G))
-        if len(components) != 0:
-            biggest_component_size = max(len(c) for c in components)
-            problem_components = [c for c in components if len(c) != biggest_component_size]
-            for component in problem_components:
-                for node in component:
-                    self.G.remove_node(node)        
-                              
-            
-            for x in range(len(self.nodexvals)):
-                self.nodexvals[x] = None
-                self.nodeyvals[x] = None
-                self.nodezvals[x] = None
-            
-            for i in self.G.nodes:
-                self.nodexvals[i] = self.G.nodes[i]['pos'][0]
-                self.nodeyvals[i] = self.G.nodes[i]['pos'][1]
-                self.nodezvals[i] = self.G.nodes[i]['pos'][2]
-            
+        # label every node's component in one pass over the sparse adjacency
+        adjacency = self._adjacency()
+        ncomponents, labels = connected_components(adjacency, directed=False)
         
+        alive = self._alive()
+        keep = alive & (np.diff(adjacency.indptr) > 0)
+        
+        if keep.any():
+            sizes = np.bincount(labels[keep], minlength=ncomponents)
+            keep &= sizes[labels] == sizes.max()
+        
+        removed = np.flatnonzero(alive & ~keep)
+        self.G.remove_nodes_from(removed.tolist())
+        self._forget(removed)
+        
+        if compact:
+            nodes = np.flatnonzero(keep)
+            newlabel = np.full(len(keep), -1)
+            newlabel[nodes] = np.arange(len(nodes))
+            
+            self._build(self._positions()[nodes], newlabel[self._edges()])
     
-    
-    def findAngles(self):
+    def _angleBlocks(self, unordered=False, valences=None, chunk=65536):
         '''
-        Finds all the angles, stores them in self.angles, but does not display them or create a figure --> see visualizeAngles() for that 
+        Computes the angle (in degrees) between every pair of edges that share a node, one block of nodes at a time
+        Nodes are grouped by valence, so for each valence d the edge vectors of up to chunk of those nodes are gathered into one (nodes, d, 3) 
+        block and all d*d cosines come from a single batched product instead of one np.dot per pair
+        unordered = False --> both (a, b) and (b, a) are counted for each pair, in the same order as itertools.permutations (like the old loop)
+                    True --> each pair of edges is counted once, half the work
+        valences = None or list of valences --> only the angles at nodes with one of these valences
+        yields (nodes, angles) --> labels of the nodes in the block and an (nodes, pairs per node) array of their angles
         '''
         
-        angles = []
+        adjacency = self._adjacency()
+        adjacency.sort_indices()
+        coords = self._positions()
+        degree = np.diff(adjacency.indptr)
         
-        for node in self.G.nodes:
-            perms = permutations(list(self.G.neighbors(node)), 2)
+        include = degree >= 2
+        if valences is not None:
+            include &= np.isin(degree, valences)
+        
+        for d in np.unique(degree[include]):
+            if unordered:
+                i, j = np.triu_indices(d, 1)
+            else:
+                i, j = np.nonzero(~np.eye(d, dtype=bool))
             
-            nodecoords = np.array(self.G.nodes[node]['pos'])
+            valencenodes = np.flatnonzero(include & (degree == d))
             
-            for combs in list(perms):
+            for start in range(0, len(valencenodes), chunk):
+                nodes = valencenodes[start:start + chunk]
                 
-                edge1 = np.array(self.G.nodes[list(combs)[0]]['pos'])
-                edge2 = np.array(self.G.nodes[list(combs)[1]]['pos'])
+                neighbours = adjacency.indices[adjacency.indptr[nodes][:, None] + np.arange(d)]
+                vectors = minimumImage(coords[neighbours] - coords[nodes][:, None, :], self.box)
                 
-                nc1 = edge1 - nodecoords
-                nc2 = edge2 - nodecoords
+                norms = np.sqrt(np.einsum('nid,nid->ni', vectors, vectors))
+                cosines = np.einsum('nid,njd->nij', vectors, vectors) / (norms[:, :, None]*norms[:, None, :])
                 
-                cosine_angle = np.dot(nc1, nc2) / (np.linalg.norm(nc1) * np.linalg.norm(nc2))
-                angle = np.arccos(cosine_angle) 
-
-                angles.append(angle)
-            
-                
-        self.angles = np.rad2deg(angles)
+                yield nodes, np.rad2deg(np.arccos(cosines[:, i, j]))
+    
+    def _angles(self, unordered=False, valences=None):
+        '''
+        returns a numpy array of all the angles from _angleBlocks, grouped node by node in label order
+        '''
+        
+        degree = np.diff(self._adjacency().indptr)
+        
+        pairs = degree*(degree - 1)
+        if unordered:
+            pairs = pairs//2
+        if valences is not None:
+            pairs[~np.isin(degree, valences)] = 0
+        
+        offsets = np.concatenate(([0], np.cumsum(pairs)))
+        angles = np.empty(offsets[-1])
+        
+        for nodes, values in self._angleBlocks(unordered=unordered, valences=valences):
+            angles[offsets[nodes][:, None] + np.arange(values.shape[1])] = values
+        
+        return angles
+    
+    def findAngles(self, unordered=False, accumulate=False, binwidth=1):
+        '''
+        Finds all the angles, stores them in self.angles, but does not display them or create a figure --> see visualizeAngles() for that 
+        unordered = False --> every angle is stored twice, once for each order of the two edges (same as always)
+                    True --> every angle is stored once, half the work and memory, same distribution
+        accumulate = True --> instead of storing every angle, they are folded into a fixed-bin histogram (self.anglehist, see Histogram.py)
+                     as they are computed, so memory use doesn't grow with the lattice. self.angles is set to None
+        binwidth = width of the angle bins in degrees when accumulate=True
+        '''
+        
+        if not accumulate:
+            self.angles = self._angles(unordered=unordered)
+            self.anglehist = None
+            return
+        
+        self.angles = None
+        self.anglehist = Histogram(0, 180, int(np.ceil(180/binwidth)))
+        
+        for nodes, values in self._angleBlocks(unordered=unordered):
+            self.anglehist.add(values)
         
     def visualizeAngles(self, bool):
         '''
         Creates a plotly figure 
-        self.findAngles() must be called first/
+        self.findAngles() must be called first/ --> if it was called with accumulate=True the histogram bins are plotted instead of the raw angles
         bool = True or False, if True the figure will be displayed, else it will be store in self.anglefig
         '''
         
-        fig = go.Figure(data=[go.Histogram(x = self.angles)])
+        if self.angles is None and self.anglehist is not None:
+            # findAngles(accumulate=True) was used --> plot the pre-binned counts
+            fig = go.Figure(data=[go.Bar(x=self.anglehist.centers, y=self.anglehist.counts, width=self.anglehist.width)])
+        else:
+            fig = go.Figure(data=[go.Histogram(x = self.angles)])
         
         fig.update_xaxes(title_text = 'Angle between nodes (degrees)')
         
@@ -443,86 +1036,245 @@ class Network:
     def findSpecificValenceAngles(self, value):
         '''
         Finds and returns a fig of the angles for nodes of a specified valence
-        value = integer from 1 to highest valence value
+        value = integer from 1 to highest valence value, or a list of them
         '''
         
-        vnodes = []
-        angles = []
-    
-        for node in self.G.nodes:
-            if self.G.degree[node] in value:
-                vnodes.append(node)
-                
-        for node in vnodes:
-            perms = permutations(list(self.G.neighbors(node)), 2)
-            
-            nodecoords = np.array(self.G.nodes[node]['pos'])
-            
-            for combs in list(perms):
-                
-                edge1 = np.array(self.G.nodes[list(combs)[0]]['pos'])
-                edge2 = np.array(self.G.nodes[list(combs)[1]]['pos'])
-                
-                nc1 = edge1 - nodecoords
-                nc2 = edge2 - nodecoords
-                
-                cosine_angle = np.dot(nc1, nc2) / (np.linalg.norm(nc1) * np.linalg.norm(nc2))
-                angle = np.rad2deg(np.arccos(cosine_angle))
-                
-                angles.append(angle)
+        angles = self._angles(valences=value)
         
         fig = go.Figure(data=[go.Histogram(x = angles)]) 
         
         return fig
     
+    def valenceAngleHistogram(self, value, binwidth=1):
+        '''
+        same angles as findSpecificValenceAngles(), folded into a Histogram (see Histogram.py) as they are computed instead of a figure of every angle
+        value = integer from 1 to highest valence value, or a list of them
+        binwidth = width of the angle bins in degrees
+        '''
+        
+        histogram = Histogram(0, 180, int(np.ceil(180/binwidth)))
+        
+        for nodes, values in self._angleBlocks(valences=value):
+            histogram.add(values)
+        
+        return histogram
+    
+    def findRings(self, maxring=12, processes=None):
+        '''
+        Finds the shortest closed loop (ring) through every edge and every node, stored in self.edgerings / self.noderings and
+        counted in self.ringhist (see rings.py for how)
+        maxring = longest ring looked for, edges/nodes without a ring up to that size get 0 --> keeps the search local and fast
+        processes = None to run in this process, or the number of processes to spread the edges over
+        '''
+        
+        adjacency = self._adjacency()
+        edges = self._edges()
+        
+        self.edgerings = edgeRings(adjacency.indptr, adjacency.indices, edges, maxring=maxring, processes=processes)
+        
+        # the shortest ring through a node is the shortest ring through one of its edges
+        rings = np.full(len(self._alive()), maxring + 1, dtype=np.int64)
+        found = np.where(self.edgerings == 0, maxring + 1, self.edgerings)
+        np.minimum.at(rings, edges[:, 0], found)
+        np.minimum.at(rings, edges[:, 1], found)
+        rings[rings > maxring] = 0
+        self.noderings = rings
+        
+        self.ringhist = Histogram(0, maxring + 1, maxring + 1)
+        self.ringhist.add(rings[self._alive()])
+        
+        return self.noderings
+    
+    def plotRings(self, bool):
+        '''
+        plots the shortest ring size through each node, runs findRings() first if it hasn't been
+        bool = True or False --> if True, figure is displayed, else it is just stored in self.ringfig
+        '''
+        
+        if self.ringhist is None:
+            self.findRings()
+        
+        # bin 0 holds the nodes without a ring, left out of the bars
+        fig = go.Figure([go.Bar(x=list(range(1, len(self.ringhist.counts))), y=self.ringhist.counts[1:])])
+        fig.update_xaxes(title_text = 'Shortest Ring Size (edges)')
+        fig.update_layout(title={'text':'Shortest Ring Through Each Node', 'xanchor': 'center', 'yanchor':'top'}, title_x=0.5)
+        
+        self.ringfig = fig
+        
+        if bool == True:
+            fig.show()
+    
+    def connectivity(self):
+        '''
+        returns a dict with the Euler characteristic of the lattice and the measures that come from it
+        euler = nodes - edges, components = connected pieces, loops = independent loops (edges - nodes + components),
+        volume = periodic box volume, or the bounding box of the nodes, density = loops/volume (connectivity density, like Conn.D for bone)
+        '''
+        
+        alive = self._alive()
+        nodes = int(alive.sum())
+        edges = self.G.number_of_edges()
+        components = connected_components(self._adjacency(), directed=False)[1][alive]
+        components = len(np.unique(components))
+        
+        volume = self._volume(alive)
+        loops = edges - nodes + components
+        
+        return {'euler': nodes - edges, 'components': components, 'loops': loops, 'volume': volume,
+                'density': loops/volume if volume != 0 else np.nan}
+    
+    def _volume(self, alive):
+        '''
+        returns the volume the lattice fills --> the periodic box, or the bounding box of the alive nodes for a finite lattice
+        '''
+        if self.box is not None:
+            return float(np.prod(self.box))
+        if not alive.any():
+            return 0.0
+        return float(np.prod(np.ptp(self._positions()[alive], axis=0)))
+    
+    def findEdgeLengths(self, binwidth=0.02):
+        '''
+        Folds the length of every edge (strut) into self.lengthhist (see Histogram.py) --> see plotEdgeLengths() for the figure
+        binwidth = width of the length bins, in the same units as the node coordinates (lattice spacing = 1)
+        '''
+        
+        coords = self._positions()
+        edges = self._edges()
+        
+        lengths = np.linalg.norm(minimumImage(coords[edges[:, 1]] - coords[edges[:, 0]], self.box), axis=1)
+        
+        nbins = max(1, int(np.ceil(lengths.max()/binwidth))) if len(lengths) != 0 else 1
+        self.lengthhist = Histogram(0, nbins*binwidth, nbins)
+        self.lengthhist.add(lengths)
+    
+    def plotEdgeLengths(self, bool):
+        '''
+        plots the edge length distribution, runs findEdgeLengths() first if it hasn't been
+        bool = True or False --> if True, figure is displayed, else it is just stored in self.lengthfig
+        '''
+        
+        if self.lengthhist is None:
+            self.findEdgeLengths()
+        
+        fig = go.Figure([go.Bar(x=self.lengthhist.centers, y=self.lengthhist.counts, width=self.lengthhist.width)])
+        fig.update_xaxes(title_text = 'Edge Length')
+        fig.update_layout(title={'text':'Distribution of edge lengths', 'xanchor': 'center', 'yanchor':'top'}, title_x=0.5)
+        
+        self.lengthfig = fig
+        
+        if bool == True:
+            fig.show()
+    
+    def findPairDistribution(self, cutoff=3, binwidth=0.05):
+        '''
+        Computes the radial pair distribution function g(r) of the nodes up to cutoff, stored in self.pairdist as (r, g) arrays
+        (g = 1 --> as many nodes at that distance as in a uniform random cloud of the same density)
+        The pairs in every distance shell are counted with one KD-tree count_neighbors call over all the bin edges, so the pairs are never listed
+        For a finite lattice the nodes near the surface have fewer neighbours, which pulls g(r) down as r grows --> use periodic=True lattices for bulk values
+        cutoff = largest distance, at most half the box for a periodic lattice
+        binwidth = width of the distance shells
+        '''
+        
+        if self.box is not None and cutoff > np.min(self.box)/2:
+            raise ValueError("cutoff {} is more than half the periodic box {}".format(cutoff, self.box))
+        
+        alive = self._alive()
+        coords = self._positions()[alive]
+        n = len(coords)
+        
+        radii = np.arange(int(np.ceil(cutoff/binwidth)) + 1)*binwidth
+        r = (radii[:-1] + radii[1:])/2
+        
+        if n < 2:
+            self.pairdist = (r, np.zeros(len(r)))
+            return self.pairdist
+        
+        tree = cKDTree(coords, boxsize=self.box)
+        counts = np.diff(tree.count_neighbors(tree, radii)).astype(float)      # ordered pairs in each shell, self pairs all fall at r = 0
+        
+        volume = self._volume(alive)
+        density = n/volume if volume != 0 else np.nan
+        shells = 4/3*np.pi*np.diff(radii**3)
+        
+        self.pairdist = (r, counts/(n*density*shells))
+        
+        return self.pairdist
+    
+    def plotPairDistribution(self, bool):
+        '''
+        plots g(r), runs findPairDistribution() first if it hasn't been
+        bool = True or False --> if True, figure is displayed, else it is just stored in self.pairfig
+        '''
+        
+        if self.pairdist is None:
+            self.findPairDistribution()
+        
+        r, g = self.pairdist
+        
+        fig = go.Figure([go.Scatter(x=r, y=g, mode='lines')])
+        fig.update_xaxes(title_text = 'r (distance between nodes)')
+        fig.update_yaxes(title_text = 'g(r)')
+        fig.update_layout(title={'text':'Pair distribution function', 'xanchor': 'center', 'yanchor':'top'}, title_x=0.5)
+        
+        self.pairfig = fig
+        
+        if bool == True:
+            fig.show()
+    
     def connectNeighbours(self):
         '''
         Connects deadend nodes to their nearest neighbours
+        All deadends are collected at once and their nearest nodes (other than the one they are already connected to) come from 
+        one batched KD-tree query, then the new edges are added in bulk. Repeats until no deadends are left (one pass normally does it)
         '''
         
-
-        for node1 in self.G.nodes:
-            if self.G.degree[node1] == 1:
-                
-                
-                xnode = list(self.G.edges(node1))[0][1]
-                minnode = -1
-                mindistance = np.inf
-                
-                for node2 in self.G.nodes:
-                    
-                    node1coords = np.array(self.G.nodes[node1]['pos'])
-                    node2coords = np.array(self.G.nodes[node2]['pos'])
-                    
-                    distance = np.linalg.norm(node1coords-node2coords)
-                    
-                    if distance != 0 and distance<mindistance and node2 != xnode:
-                        mindistance = distance
-                        minnode  = node2
-                        
-                self.G.add_edge(node1, minnode)   
-        for node2 in self.G.nodes:
-            if self.G.degree[node2] == 1:
+        if self.G.number_of_nodes() == 0:
+            return
+        
+        while True:
+            adjacency = self._adjacency()
+            degree = np.diff(adjacency.indptr)
+            deadends = np.flatnonzero(degree == 1)
+            
+            if len(deadends) == 0:
+                return
+            
+            partner = adjacency.indices[adjacency.indptr[deadends]]
+            
+            nodes = np.fromiter(self.G.nodes, dtype=np.intp)
+            coords = self._positions()
+            tree = cKDTree(coords[nodes], boxsize=self.box)
+            
+            nearest = np.full(len(deadends), -1)
+            todo = np.arange(len(deadends))
+            k = 3
+            
+            # the nearest node that isn't the deadend itself (or on top of it) or its partner is almost always within the 3 closest, 
+            # the few that aren't get asked again with a bigger k
+            while len(todo) != 0:
+                k = min(k, len(nodes))
+                distance, index = tree.query(coords[deadends[todo]], k=k)
+                distance = distance.reshape(len(todo), k)
+                candidate = nodes[index.reshape(len(todo), k)]
                 
+                valid = (distance != 0) & (candidate != partner[todo, None])
+                found = valid.any(axis=1)
                 
-                xnode = list(self.G.edges(node2))[0][1]
-                minnode = -1
-                mindistance = np.inf
+                nearest[todo[found]] = candidate[found, valid[found].argmax(axis=1)]
+                todo = todo[~found]
                 
-                for node3 in self.G.nodes:
-                    
-                    node1coords = np.array(self.G.nodes[node2]['pos'])
-                    node2coords = np.array(self.G.nodes[node3]['pos'])
-                    
-                    distance = np.linalg.norm(node1coords-node2coords)
-                    
-                    if distance != 0 and distance<mindistance and node3 != xnode:
-                        mindistance = distance
-                        minnode  = node2
-                        
-                self.G.add_edge(node1, minnode)   
+                if k == len(nodes):
+                    break
+                k *= 4
+            
+            pairs = np.column_stack((deadends, nearest))[nearest != -1]
+            
+            if len(pairs) == 0:
+                return
+            
+            self.G.add_edges_from(pairs.tolist())
                         
-                    
     def getnodedict(self):
         '''
         returns a dictionary of nodes with their xyz coordinates
@@ -537,55 +1289,176 @@ class Network:
             
         return node_pos
     
+    def _forget(self, nodes):
+        '''
+        sets the stored coordinates of removed nodes to None (nan with the array backend)
+        '''
+        if self.backend == 'array':
+            self.G._own()
+            self.G.coords[np.asarray(nodes, dtype=np.intp)] = np.nan
+            self.nodexvals, self.nodeyvals, self.nodezvals = self.G.coords.T
+            return
+        
+        for node in nodes:
+            self.nodexvals[node] = None
+            self.nodeyvals[node] = None
+            self.nodezvals[node] = None
+    
     def removeKinks(self):
         '''
         Removes any kinks in the lattice
+        Works through a queue of valence 2 nodes until there are none left: each kink is replaced by an edge between its two neighbours,
+        and only a neighbour whose valence changed because of that is checked again --> O(N+E), no matter how long the kinked chains are
         '''
-        for i in range(10):
-            kinks = []
-            for node in self.G.nodes:
-                if self.G.degree[node] == 2:
-                    
-                    neighbors = list(self.G.neighbors(node))
-                    
-                    self.G.add_edge(u_of_edge=neighbors[0], v_of_edge=neighbors[1])
-                    kinks.append(node)
-                    self.nodexvals[node] = None
-                    self.nodeyvals[node] = None
-                    self.nodezvals[node] = None
-                
+        worklist = deque(node for (node, val) in self.G.degree() if val == 2)
+        kinks = []
+        
+        while worklist:
+            node = worklist.popleft()
+            
+            if node not in self.G or self.G.degree[node] != 2:
+                continue
             
-            self.G.remove_nodes_from(kinks)
-            kinks.clear()
+            neighbors = list(self.G.neighbors(node))
+            
+            self.G.add_edge(u_of_edge=neighbors[0], v_of_edge=neighbors[1])
+            self.G.remove_node(node)
+            kinks.append(node)
+            
+            # if the neighbours were already connected they each lost an edge and may be kinks now
+            for n in neighbors:
+                if self.G.degree[n] == 2:
+                    worklist.append(n)
+        
+        self._forget(kinks)
             
     def prune(self):
         '''
         removes any deadends in the lattice
+        Same result as sweeping until nothing changes: every round removes the nodes that had valence 1 when it started (so both ends
+        of an isolated edge go together), and nodes left with valence 0 by a round are kept, like the sweeps kept them. Only the
+        neighbours of the nodes removed in a round are checked for the next one, so dead end chains of any length are removed in O(N+E)
         '''
-        for i in range(10):
-            deadends = []
-            for node in self.G.nodes:
-                if self.G.degree[node] == 1:
-                    deadends.append(node)
-                
-                
-            self.G.remove_nodes_from(deadends)
-            deadends.clear()
+        current = [node for (node, val) in self.G.degree() if val == 1]
+        deadends = []
+        
+        while current:
+            touched = dict.fromkeys(n for node in current for n in self.G.neighbors(node))
+            
+            self.G.remove_nodes_from(current)
+            deadends.extend(current)
+            
+            current = [n for n in touched if n in self.G and self.G.degree[n] == 1]
+        
+        self._forget(deadends)
+        
+    def runPipeline(self, stages, trackmemory=False, cache=None, progress=None):
+        '''
+        Runs a list of stages on this Network, one after the other, and records what each one cost and changed
+        stages = list where each stage is a method name from PIPELINE_STAGES, or a (name, kwargs) tuple, e.g.
+                 [('setCubicSymmetry', {'length': 10}), ('randomize', {'chaosmult': 0.15, 'minrad': 0.6, 'maxrad': 1.1}), 'declutter', 'prune']
+        trackmemory = True to measure the peak memory allocated during each stage with tracemalloc. tracemalloc makes some stages several
+                      times slower than others (e.g. generation and compaction), so the seconds no longer show which stage dominates
+                      --> only turn it on for the memory column
+        cache = optional StageCache (see StageCache.py) --> the output of every stage is kept, keyed by the stages before it, and the pipeline
+                starts from the end of the longest prefix that is already cached. stages must then start by generating a lattice
+        progress = optional function progress(done, total, step), called with step = the stage name as each stage starts (done = stages 
+                   finished so far), with the steps inside a stage (e.g. 'reconnection' in randomize) and with step = None at the end
+        returns (and stores in self.report) a list with one dict per stage: stage, seconds, peakmemory (bytes, None if not tracked),
+        nodes, edges (after the stage), nodechange, edgechange and cached (True if it came from the cache) --> see formatReport() to print it
+        '''
+        
+        stages = [(stage, {}) if isinstance(stage, str) else stage for stage in stages]
+        
+        for name, kwargs in stages:
+            if name not in PIPELINE_STAGES:
+                raise ValueError("{} is not a pipeline stage, use one of {}".format(name, PIPELINE_STAGES))
+        
+        report = []
+        keys = [None]*len(stages) if cache is None else cache.keys(self.backend, stages)
         
+        # pick up from the longest cached prefix
+        for k in range(len(stages), 0, -1):
+            cached = cache.get(keys[k-1]) if keys[k-1] is not None else None
+            if cached is None:
+                continue
+            
+            network, rows = cached
+            self.__dict__.update(network.__dict__)
+            
+            report = [dict(row, seconds=0.0, peakmemory=None, cached=True) for row in rows]
+            cache.hits += k
+            break
+        
+        for k, ((name, kwargs), key) in enumerate(zip(stages[len(report):], keys[len(report):]), start=len(report)):
+            if progress is not None:
+                self._progress = lambda step, done=k: progress(done, len(stages), step)
+                self._progress(name)
+            
+            nodes = self.G.number_of_nodes()
+            edges = self.G.number_of_edges()
+            
+            if trackmemory:
+                started = not tracemalloc.is_tracing()
+                if started:
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            
+            start = time.perf_counter()
+            try:
+                getattr(self, name)(**kwargs)
+            finally:
+                self._progress = None
+            seconds = time.perf_counter() - start
+            
+            peak = None
+            if trackmemory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started:
+                    tracemalloc.stop()
+            
+            report.append({'stage': name, 'seconds': seconds, 'peakmemory': peak,
+                           'nodes': self.G.number_of_nodes(), 'edges': self.G.number_of_edges(),
+                           'nodechange': self.G.number_of_nodes() - nodes, 'edgechange': self.G.number_of_edges() - edges, 'cached': False})
+            
+            if key is not None:
+                cache.misses += 1
+                cache.put(key, self, report)
+        
+        self.report = report
+        
+        if progress is not None:
+            progress(len(stages), len(stages), None)
+        
+        return report
+    
     def clear(self):  
         '''
         Clears Network object
         '''
-        self.G = nx.Graph()
+        self.G = self._newGraph()
         self.symmetry = None
         self.nodexvals = None
         self.nodeyvals = None
         self.nodezvals = None
         self.unitcell = None
+        self.box = None
         self.angles = None 
+        self.anglehist = None
+        self.degreehist = None
+        self.edgerings = None
+        self.noderings = None
+        self.ringhist = None
+        self.lengthhist = None
+        self.pairdist = None
         self.degreefig = None 
         self.anglefig = None
+        self.ringfig = None
+        self.lengthfig = None
+        self.pairfig = None
         self.fig = None   
+        self.report = None
             
 
 
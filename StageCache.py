@@ -0,0 +1,84 @@
+import hashlib
+import json
+import pickle
+
+from LRUStore import LRUStore
+
+'''
+StageCache memoizes the output of every stage of Network.runPipeline(), keyed by the whole chain of stages that led to it
+(symmetry and length, then randomize with its seed/chaosmult/minrad/maxrad, then each clean up stage with its arguments).
+Pipelines that share a prefix --> e.g. the same randomized lattice with prune, connectNeighbours or nothing afterwards --> only compute
+that prefix once, every later run picks up the Network from the end of the longest cached prefix and only runs the stages after it
+
+    cache = StageCache()
+    for deadends in ('prune', 'connect', 'nada'):
+        graph = nwrk.Network()
+        graph.runPipeline([('setCubicSymmetry', {'length': 20}), ('randomize', {..., 'seed': 1})] + nwrk.refinementStages(deadends), cache=cache)
+
+Only pipelines that start by generating a lattice can be cached, and only up to the first randomize without a seed (its output is
+different every time)
+'''
+
+
+GENERATORS = ('setCubicSymmetry', 'setHexagonalSymmetry', 'setBodyCenterCubic')
+
+# arguments that don't change what a stage outputs, left out of the keys
+IGNORED = ('cache', 'workers', 'processes')
+
+
+class StageCache:
+
+    def __init__(self, maxitems=64, directory=None, memoryitems=None):
+        '''
+        maxitems = most stage outputs kept, the least recently used ones are evicted past that
+        directory = optional folder to also keep them in (shared between processes, see LRUStore.py)
+        memoryitems = most stage outputs kept in memory when a directory is used (defaults to maxitems)
+        '''
+
+        self.store = LRUStore(maxitems=maxitems, directory=directory, memoryitems=memoryitems)
+
+        self.hits = 0       # stages skipped because their output was cached
+        self.misses = 0     # stages that had to be run
+
+    def keys(self, backend, stages):
+        '''
+        returns the cache key of every stage in stages (list of (name, kwargs)), the key of stage k covers stages 0..k
+        stages that can't be cached (and everything after them) get None
+        '''
+
+        if len(stages) == 0 or stages[0][0] not in GENERATORS:
+            raise ValueError("only pipelines that start with one of {} can be cached".format(GENERATORS))
+
+        keys = []
+        chain = [backend]
+
+        for name, kwargs in stages:
+            if name == 'randomize' and kwargs.get('seed') is None:
+                break
+
+            chain.append([name, {key: value for key, value in sorted(kwargs.items()) if key not in IGNORED}])
+            keys.append(hashlib.sha1(json.dumps(chain, default=str).encode()).hexdigest())
+
+        return keys + [None]*(len(stages) - len(keys))
+
+    def get(self, key):
+        '''
+        returns (Network, report rows of the stages up to this one) stored under key, or None
+        '''
+
+        cached = self.store.get(key)
+        if cached is None:
+            return None
+
+        network, rows = cached
+        return pickle.loads(network), rows
+
+    def put(self, key, network, rows):
+        '''
+        stores a snapshot of network (pickled, so later stages can't change it) and the runPipeline report rows that led to it under key
+        '''
+
+        self.store.put(key, (pickle.dumps(network, protocol=pickle.HIGHEST_PROTOCOL), [dict(row) for row in rows]))
+
+    def clear(self):
+        self.store.clear()
@@ -1,21 +1,51 @@
+import os
+import random
+import tempfile
+import uuid
+
 import Network as nwrk
+import plotupdates
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objects as go
 from dash_extensions.enrich import Input, Output, State, DashProxy, MultiplexerTransform
+from JobQueue import JobQueue
+from LatticeCache import LatticeCache
+from LRUStore import LRUStore
+from StageCache import StageCache
 
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-graph = nwrk.Network()
+# generating and randomizing run as background jobs in their own processes (see JobQueue.py), the page polls them for progress
+# and can cancel them. NETWORK_JOB_WORKERS = most jobs running at once, NETWORK_JOB_DIR = optional folder to share the job statuses
+# and results between the processes of a multi-process server
+jobs = JobQueue(workers=int(os.environ.get('NETWORK_JOB_WORKERS', 2)), directory=os.environ.get('NETWORK_JOB_DIR'))
+
+# the caches below are filled by the job processes, so they are kept in a folder that every process sees
+cachedir = os.environ.get('NETWORK_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'network-cache'))
+
+# generated lattices only depend on (symmetry, length) so each one is generated once and copied after that (see LatticeCache.py)
+lattices = LatticeCache(maxitems=8, directory=os.environ.get('NETWORK_LATTICE_DIR', os.path.join(cachedir, 'lattices')))
+
+# output of every pipeline stage, keyed by the stages that led to it (see StageCache.py) --> trying other kinks/deadends options
+# on the same seed only reruns the stages that changed
+stagecache = StageCache(maxitems=64, directory=os.environ.get('NETWORK_STAGE_DIR', os.path.join(cachedir, 'stages')))
+
+# every browser session gets its own Network, kept server side under its session id (see LRUStore.py)
+# with NETWORK_SESSION_DIR set they are pickled to that folder, so every worker of a multi-process server sees the same ones
+# --> e.g. NETWORK_SESSION_DIR=/tmp/networks gunicorn -w 4 app:server
+# (each session keeps 3 entries: its Network, the geometry last sent to the browser and its chain of stages)
+sessions = LRUStore(maxitems=int(os.environ.get('NETWORK_SESSION_LIMIT', 96)), directory=os.environ.get('NETWORK_SESSION_DIR'))
 
 colours = {'text' : '#27213C'}
 
 app = DashProxy(__name__, external_stylesheets=external_stylesheets, transforms=[MultiplexerTransform()], prevent_initial_callbacks=True)
+server = app.server
 
 
-app.layout = html.Div([html.Div([html.H4("Interactive Visualization of 3D Lattices", style={'textAlign' : 'center', 'backgroundColor' : '#ff9999'}
+layout = html.Div([html.Div([html.H4("Interactive Visualization of 3D Lattices", style={'textAlign' : 'center', 'backgroundColor' : '#ff9999'}
 )]), 
     
 html.Div([
@@ -41,7 +71,10 @@ html.Div(style={'backgroundColor':'#FFD4CB'}),
 html.Div([dcc.Dropdown(id='kinks', options=[{'label':'No kink straightening', 'value':'yeskinks'}, {'label':'Straighten kinks', 'value':'nokinks'}])], style={'width':'45%', 'margin-left':'29px', 'display':'inline-block'}),
 html.Div([dcc.Dropdown(id='deadends', options=[{'label':'Prune', 'value':'prune'}, {'label':'Connect to nearest neighbor', 'value':'connect'}, {'label':'Do nothing', 'value':'nada'}])], style={'width':'45%', 'display':'inline-block'}),
 html.Div(style={'margin-bottom':'30px'}),
-html.Div(children=[html.Button('Randomize', id='randomize', n_clicks=0)], style={'margin-bottom':'30px','margin-left':'290px'}),
+html.Div(children=[html.Button('Randomize', id='randomize', n_clicks=0)], style={'margin-bottom':'30px','margin-left':'290px', 'display':'inline-block'}),
+html.Div(children=[dcc.Input(id='seed', type='number', placeholder='Seed (optional)')], style={'display':'inline-block', 'margin-left':'20px'}),
+html.Div(children=[html.Button('Cancel', id='cancel', n_clicks=0)], style={'display':'inline-block', 'margin-left':'20px'}),
+html.Div(id='jobstatus', style={'margin-left':'60px', 'margin-bottom':'30px'}),
 html.Div([html.H6('Select node valence to display angle distribution', style={'textAlign':'center', 'margin-bottom':'35px','backgroundColor':'#cce6ff'})]),
 html.Div(dcc.Checklist(id='checker',
     options=[
@@ -58,102 +91,315 @@ html.Div(dcc.Checklist(id='checker',
 html.Div(id='dummy'),
 html.Div(id='numnodes', style={'display':'inline-block', 'margin-left':'165px', 'margin-right':'80px'}),
 html.Div(id='numedges', style={'margin-bottom':'100px','display':'inline-block'}),
+html.Pre(id='pipelinereport', style={'margin-left':'60px'}),
 html.Div([html.H6('Distribution of angles between nodes', style={'textAlign':'center','backgroundColor':'#cce6ff'})]),
 html.Div([dcc.Graph(id='anglegraph')], style={'margin-top':'70px'}),
 html.Div([html.H6('Node Valence', style={'textAlign':'center','backgroundColor':'#cce6ff'})]),
 html.Div([dcc.Graph(id='valencegraph')], style={'column-count':'1'})], style={'column-count':'2'})])
 
 
+def serveLayout():
+    # a new session id for every new browser tab, kept in the tab's session storage
+    # geometry = the lattice the tab is drawing, only ever changed by the updates the server sends (see plotupdates.py)
+    # job = the background job the tab is waiting on, polled by jobpoll while it runs
+    return html.Div([dcc.Store(id='session', storage_type='session', data=str(uuid.uuid4())),
+                     dcc.Store(id='geometry'), dcc.Store(id='geometryversion'), dcc.Store(id='geometryupdate'), dcc.Store(id='histograms'), 
+                     dcc.Store(id='job'), dcc.Interval(id='jobpoll', interval=500, disabled=True),
+                     layout])
+
+
+app.layout = serveLayout
+
+# most edges sent to the browser, bigger lattices are drawn with an even subsample (the full lattice stays on the server)
+maxedges = int(os.environ.get('NETWORK_MAX_EDGES', 50000))
+
+# NETWORK_TRACK_MEMORY=1 adds the peak memory of each stage to the pipeline report (tracemalloc makes the jobs several times slower)
+trackmemory = os.environ.get('NETWORK_TRACK_MEMORY') == '1'
+
+# the sessions' lattices use the array backend --> every job runs in a new process, so cached lattices and stage outputs come off
+# disk, which is only quicker than computing them again for ArrayGraphs (a networkx graph takes about as long to unpickle as to build)
+backend = 'array'
+
+symmetries = {'HEX' : 'setHexagonalSymmetry', 'CUB' : 'setCubicSymmetry', 'BCC' : 'setBodyCenterCubic'}
+
+# what the job status line calls each pipeline stage/step (the others go by their stage name)
+steps = {'setHexagonalSymmetry' : 'generation', 'setCubicSymmetry' : 'generation', 'setBodyCenterCubic' : 'generation',
+         'randomize' : 'randomization', 'reconnection' : 'reconnection', 'findAngles' : 'angles'}
+
+# every job ends by binning the angles, so the angle histogram of a new lattice doesn't have to be computed in a request
+angles = ('findAngles', {'accumulate' : True})
+
+
+# shown instead of running anything for a session whose lattice was evicted (or never generated)
+expired = 'Session expired, generate a lattice'
+
+
+def loadGraph(session):
+    '''
+    returns the Network of a session, a new empty one if it has none yet (or it was evicted)
+    '''
+    graph = sessions.get(session)
+    return nwrk.Network(backend) if graph is None else graph
+
+
+def runChain(graph, chain, progress=None):
+    '''
+    runs a session's whole chain of stages (generation first) on graph through the stage cache, so only the stages after the 
+    longest prefix run before are computed, returns the report
+    '''
+    name, kwargs = chain[0]
+    return graph.runPipeline([(name, dict(kwargs, cache=lattices))] + chain[1:], cache=stagecache, progress=progress, trackmemory=trackmemory)
+
+
+def buildChain(chain, progress):
+    '''
+    background job (see JobQueue.py) --> runs a chain of stages and the angles on a new Network, returns (Network, report, chain)
+    '''
+    graph = nwrk.Network(backend)
+    return graph, runChain(graph, chain + [angles], progress), chain
+
+
+def continueGraph(graph, stages, progress):
+    '''
+    background job --> runs stages and the angles on an existing Network, for sessions whose chain was evicted, returns (Network, report, None)
+    '''
+    return graph, graph.runPipeline(stages + [angles], progress=progress, trackmemory=trackmemory), None
+
+
+def submitJob(job, function, *args):
+    '''
+    cancels the job the tab was waiting on (if any) and submits function(*args) instead
+    returns the new job, whether its polling is disabled (False) and the job status line
+    '''
+    if job is not None:
+        jobs.cancel(job['id'])
+    
+    return {'id' : jobs.submit(function, *args)}, False, 'Queued'
+
+
+def jobProgress(status):
+    '''
+    returns the job status line for a queued or running job
+    '''
+    if status['state'] == 'queued' or status['total'] is None:
+        return 'Queued'
+    
+    step = steps.get(status['step'], status['step'])
+    return 'Running: {} (stage {} of {})'.format(step, min(status['done'] + 1, status['total']), status['total'])
+
+
+def geometryUpdate(graph, session, version):
+    '''
+    returns the update that brings the lattice plot of a tab up to date with graph
+    version = version of the geometry the tab has --> if it isn't the one last sent to it, the whole geometry is sent again
+    '''
+    new = plotupdates.plotGeometry(graph, maxedges=maxedges)
+    
+    sent = sessions.get(session + '/geometry')
+    old = sent['geometry'] if sent is not None and version is not None and sent['version'] == version else None
+    
+    update = plotupdates.geometryDelta(old, new)
+    update['base'] = version
+    update['version'] = (version or 0) + 1
+    
+    sessions.put(session + '/geometry', {'version': update['version'], 'geometry': new})
+    
+    return update
+
+
 @app.callback(
-    Output('network', 'figure'),
+    Output('job', 'data'),
+    Output('jobpoll', 'disabled'),
+    Output('jobstatus', 'children'),
     [Input('generate', 'n_clicks')],
     state = [State('symmetry_selector', 'value'),
-    State('length', 'value')])
-def selectSymmetry(n_clicks, symmetry_selector, length):
+    State('length', 'value'),
+    State('job', 'data')])
+def selectSymmetry(n_clicks, symmetry_selector, length, job):
     
-    if symmetry_selector == 'HEX':
-        graph.setHexagonalSymmetry(length=length)
-        graph.visualizeGraph(bool=False)
-        return graph.fig
+    # every stage the session's lattice went through, the stage cache is keyed by it
+    chain = [(symmetries[symmetry_selector], {'length' : length})]
     
-    if symmetry_selector == 'CUB':
-        graph.setCubicSymmetry(length=length)
-        graph.visualizeGraph(bool=False)
-        return graph.fig 
+    return submitJob(job, buildChain, chain)
+
+
+@app.callback(
+    Output('geometryupdate', 'data'),
+    Output('pipelinereport', 'children'),
+    Output('jobstatus', 'children'),
+    Output('jobpoll', 'disabled'),
+    Input('jobpoll', 'n_intervals'),
+    State('job', 'data'),
+    State('session', 'data'),
+    State('geometryversion', 'data'))
+def pollJob(n_intervals, job, session, version):
+    
+    skip = dash.no_update
+    status = jobs.status(job['id']) if job is not None else None
+    
+    if status is None:
+        return skip, skip, 'The job was lost (the server restarted or forgot it), please run it again', True
+    if status['state'] in ('queued', 'running'):
+        return skip, skip, jobProgress(status), False
+    if status['state'] == 'cancelled':
+        return skip, skip, 'Cancelled', True
+    if status['state'] == 'failed':
+        return skip, skip, 'Failed: {}'.format(status['error'].strip().splitlines()[-1]), True
     
-    if symmetry_selector == 'BCC':
-        graph.setBodyCenterCubic(length=length)
-        graph.visualizeGraph(bool=False)
-        return graph.fig 
+    # done --> the result is taken out of the store, so a poll that was already on its way doesn't apply it twice
+    result = jobs.results.pop(job['id'])
+    if result is None:
+        return skip, skip, skip, True
     
+    graph, report, chain = result
+    sessions.put(session, graph)
+    if chain is not None:
+        sessions.put(session + '/chain', chain)
     
+    return geometryUpdate(graph, session, version), nwrk.formatReport(report), 'Done', True
+
+
 @app.callback(
-    Output('anglegraph', 'figure'),
-    Output('valencegraph', 'figure'),   
-    Input('network', 'figure'),
-    Input('checker', 'value'))
-def updateData(figure, value):
+    Output('jobstatus', 'children'),
+    Input('cancel', 'n_clicks'),
+    State('job', 'data'))
+def cancelJob(n_clicks, job):
+    
+    if job is None or not jobs.cancel(job['id']):
+        return 'Nothing to cancel'
+    
+    return 'Cancelling'
+
+
+# runs in the browser --> applies an update from geometryUpdate() to the geometry the tab has and draws it
+app.clientside_callback(
+    '''
+    function(update, geometry) {
+        var coords, edges;
+        
+        if (update.reset) {
+            coords = update.coords;
+            edges = update.edges;
+        } else if (geometry && geometry.version === update.base) {
+            coords = geometry.coords.slice();
+            update.index.forEach(function(n, k) { coords[n] = update.coords[k]; });
+            
+            var removed = new Set(update.removed.map(function(e) { return e[0] + ',' + e[1]; }));
+            edges = geometry.edges.filter(function(e) { return !removed.has(e[0] + ',' + e[1]); }).concat(update.added);
+        } else {
+            var skip = window.dash_clientside.no_update;
+            return [skip, skip, skip];
+        }
+        
+        var nodes = {x: [], y: [], z: []};
+        coords.forEach(function(p) {
+            if (p !== null) { nodes.x.push(p[0]); nodes.y.push(p[1]); nodes.z.push(p[2]); }
+        });
+        
+        var lines = {x: [], y: [], z: []};
+        edges.forEach(function(e) {
+            var a = coords[e[0]], b = coords[e[1]];
+            lines.x.push(a[0], b[0], null); lines.y.push(a[1], b[1], null); lines.z.push(a[2], b[2], null);
+        });
+        
+        var figure = {data: [{type: 'scatter3d', mode: 'markers', marker: {size: 3}, x: nodes.x, y: nodes.y, z: nodes.z},
+                             {type: 'scatter3d', mode: 'lines', x: lines.x, y: lines.y, z: lines.z}],
+                      layout: {uirevision: 'lattice'}};
+        
+        return [figure, {version: update.version, coords: coords, edges: edges}, update.version];
+    }
+    ''',
+    Output('network', 'figure'),
+    Output('geometry', 'data'),
+    Output('geometryversion', 'data'),
+    Input('geometryupdate', 'data'),
+    State('geometry', 'data'))
     
+    
+@app.callback(
+    Output('histograms', 'data'),
+    Output('jobstatus', 'children'),
+    Input('geometryversion', 'data'),
+    Input('checker', 'value'),
+    State('session', 'data'))
+def updateData(version, value, session):
+    
+    graph = loadGraph(session)
+    
+    if graph.G.number_of_nodes() == 0:
+        return dash.no_update, expired
+    
+    # only the binned counts get sent to the browser (the jobs already binned the angles of every node)
     if len(value) == 0:
-        graph.findAngles()
-        graph.visualizeAngles(bool=False)
-        graph.plotDegree(bool=False)
-        return graph.anglefig, graph.degreefig
+        if graph.anglehist is None:
+            graph.findAngles(accumulate=True)
+        histogram = graph.anglehist
     else:
-        x = graph.findSpecificValenceAngles(value=value)
-        graph.plotDegree(bool=False)
-        
-        return x, graph.degreefig
+        histogram = graph.valenceAngleHistogram(value=value)
+    
+    graph.plotDegree(bool=False)
+    
+    return {'angles': plotupdates.histogramBins(histogram), 'degree': plotupdates.histogramBins(graph.degreehist, centers=False)}, dash.no_update
+
+
+app.clientside_callback(
+    '''
+    function(histograms) {
+        function bars(bins, title, xtitle) {
+            return {data: [{type: 'bar', x: bins.x, y: bins.y, width: bins.width}],
+                    layout: {title: {text: title, x: 0.5, xanchor: 'center', yanchor: 'top'}, xaxis: {title: {text: xtitle}}}};
+        }
+        return [bars(histograms.angles, 'Distribution of angles between nodes', 'Angle between nodes (degrees)'),
+                bars(histograms.degree, 'Lattice Node Valence', 'Node Valence')];
+    }
+    ''',
+    Output('anglegraph', 'figure'),
+    Output('valencegraph', 'figure'),
+    Input('histograms', 'data'))
     
     
 @app.callback(
-    Output('network', 'figure'),
+    Output('job', 'data'),
+    Output('jobpoll', 'disabled'),
+    Output('jobstatus', 'children'),
     [Input('randomize', 'n_clicks')],
     state=[State('chaos', 'value'),
      State('minrad', 'value'),
      State('maxrad', 'value'),
      State('kinks', 'value'),
-     State('deadends', 'value')])
-def randomize(clicks, chaos, minrad, maxrad, kinks, deadends):
+     State('deadends', 'value'),
+     State('seed', 'value'),
+     State('session', 'data'),
+     State('job', 'data')])
+def randomize(clicks, chaos, minrad, maxrad, kinks, deadends, seed, session, job):
     
-    graph.randomize(chaosmult=chaos, minrad=minrad, maxrad=maxrad)
-    graph.declutter()
+    # with a seed the lattice is randomized again from the generated one, so changing only the kinks/deadends options reuses the 
+    # cached randomization. Without one every click randomizes the current lattice further (a drawn seed still lets it be cached)
+    restart = seed is not None
+    seed = random.randrange(2**32) if seed is None else seed
     
-    if deadends=='nada':
-        pass
+    stages = [('randomize', {'chaosmult' : chaos, 'minrad' : minrad, 'maxrad' : maxrad, 'seed' : seed})]
+    stages += nwrk.refinementStages(deadends=deadends, kinks=(kinks == 'nokinks'))
     
-    if deadends=='prune':
-        graph.prune()
-        
-    if deadends=='connect':
-        graph.connectNeighbours()
-        
-    if kinks=='nokinks':
-        graph.removeKinks()
-        
-    if deadends=='prune':
-        graph.prune()    
-        
-    if kinks=='nokinks':
-        graph.removeKinks()
+    chain = sessions.get(session + '/chain')
     
-    if deadends=='connect':
-        graph.connectNeighbours()    
-    
-    if kinks=='yeskinks':
-        pass
+    if chain is None:
+        # the chain was evicted, just carry on from the session's lattice (if that wasn't evicted too)
+        graph = loadGraph(session)
+        if graph.G.number_of_nodes() == 0:
+            return dash.no_update, dash.no_update, expired
         
-    graph.declutter()
-    
-    graph.visualizeGraph(bool=False)
+        return submitJob(job, continueGraph, graph, stages)
     
-    return graph.fig
+    return submitJob(job, buildChain, (chain[:1] if restart else chain) + stages)
 
 @app.callback(
     Output('numnodes', 'children'),
     Output('numedges', 'children'),
-    Input('network', 'figure'))
-def updateNumNodesEdges(figure):
+    Input('geometryversion', 'data'),
+    State('session', 'data'))
+def updateNumNodesEdges(version, session):
+    graph = loadGraph(session)
     nodes = 'Number of Nodes: {}'.format(graph.G.number_of_nodes())
     edges = 'Number of Edges: {}'.format(graph.G.number_of_edges())
     return nodes, edges
@@ -0,0 +1,219 @@
+import argparse
+import copy
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import plotly.graph_objects as go
+
+import Network as nwrk
+
+'''
+Scaling benchmarks for every Network operation.
+For each symmetry and each lattice length this times lattice generation, randomize, declutter, prune, removeKinks, connectNeighbours,
+findAngles, plotDegree and visualizeGraph (with fixed seeds so every run does the same work), fits how the time grows with the
+number of nodes, writes everything to a JSON file and can compare it against a stored baseline run.
+
+Examples:
+    python benchmark.py --lengths 4 8 16 32 --output results.json --plot scaling.html
+    python benchmark.py --backend array --baseline results.json          --> exits with 1 if anything got slower than the baseline
+                                                                          (2 if the baseline used another backend, repeat or randomize settings)
+'''
+
+
+SYMMETRIES = {'Cubic': 'setCubicSymmetry', 'BCC': 'setBodyCenterCubic', 'Hexagonal': 'setHexagonalSymmetry'}
+
+# operations timed on a copy of the randomized + decluttered lattice, so each one sees the same input
+REFINEMENTS = ['declutter', 'prune', 'removeKinks', 'connectNeighbours', 'findAngles']
+
+RANDOMIZE = {'chaosmult': 0.15, 'minrad': 0.6, 'maxrad': 1.1, 'seed': 0}
+
+# settings that have to match for two runs' timings to be comparable
+COMPARABLE = ('backend', 'repeat', 'randomize')
+
+
+def timeOperation(setup, operation, repeat):
+    '''
+    runs setup() then times operation(result of setup) repeat times, returns the fastest time in seconds
+    '''
+
+    times = []
+    for i in range(repeat):
+        target = setup()
+        start = time.perf_counter()
+        operation(target)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def benchmarkLattice(symmetry, length, backend, repeat):
+    '''
+    times every operation on one lattice, returns a list of result dicts
+    '''
+
+    method = SYMMETRIES[symmetry]
+
+    def generated():
+        graph = nwrk.Network(backend)
+        getattr(graph, method)(length)
+        return graph
+
+    def randomized():
+        graph = generated()
+        graph.randomize(**RANDOMIZE)
+        graph.declutter()
+        return graph
+
+    lattice = generated()
+    refined = randomized()
+
+    timings = {}
+    timings['generate'] = timeOperation(lambda: nwrk.Network(backend), lambda graph: getattr(graph, method)(length), repeat)
+    timings['randomize'] = timeOperation(lambda: copy.deepcopy(lattice), lambda graph: graph.randomize(**RANDOMIZE), repeat)
+
+    for name in REFINEMENTS:
+        timings[name] = timeOperation(lambda: copy.deepcopy(refined), lambda graph: getattr(graph, name)(), repeat)
+
+    timings['plotDegree'] = timeOperation(lambda: refined, lambda graph: graph.plotDegree(False), repeat)
+    timings['visualizeGraph'] = timeOperation(lambda: refined, lambda graph: graph.visualizeGraph(False), repeat)
+
+    return [{'symmetry': symmetry, 'length': length, 'nodes': lattice.G.number_of_nodes(), 'edges': lattice.G.number_of_edges(),
+             'operation': name, 'seconds': seconds} for name, seconds in timings.items()]
+
+
+def scalingExponents(results):
+    '''
+    fits time ~ nodes^k for every symmetry/operation and returns {symmetry: {operation: k}}
+    k close to 1 means linear, close to 2 means quadratic
+    '''
+
+    exponents = {}
+
+    for symmetry in sorted({r['symmetry'] for r in results}):
+        exponents[symmetry] = {}
+        for operation in sorted({r['operation'] for r in results}):
+            rows = [r for r in results if r['symmetry'] == symmetry and r['operation'] == operation and r['seconds'] > 0]
+            if len({r['nodes'] for r in rows}) < 2:
+                continue
+            slope = np.polyfit(np.log([r['nodes'] for r in rows]), np.log([r['seconds'] for r in rows]), 1)[0]
+            exponents[symmetry][operation] = float(slope)
+
+    return exponents
+
+
+def mismatchedSettings(meta, baseline):
+    '''
+    returns the COMPARABLE settings that differ between this run's meta and the baseline run, as (name, baseline value, value) tuples
+    '''
+
+    old = baseline.get('meta', {})
+    return [(name, old.get(name), meta[name]) for name in COMPARABLE if old.get(name) != meta[name]]
+
+
+def compareToBaseline(results, baseline, tolerance, minseconds):
+    '''
+    compares every (symmetry, length, operation) that is in both runs
+    returns a list of (symmetry, length, operation, baseline seconds, new seconds) for the ones that got more than tolerance
+    (as a fraction) slower, ignoring differences smaller than minseconds
+    '''
+
+    old = {(r['symmetry'], r['length'], r['operation']): r['seconds'] for r in baseline['results']}
+    regressions = []
+
+    for r in results:
+        key = (r['symmetry'], r['length'], r['operation'])
+        if key not in old:
+            continue
+        if r['seconds'] > old[key]*(1 + tolerance) and r['seconds'] - old[key] > minseconds:
+            regressions.append(key + (old[key], r['seconds']))
+
+    return regressions
+
+
+def plotScaling(results, path):
+    '''
+    writes log-log scaling curves (time against number of nodes, one line per operation and symmetry) to an html file
+    '''
+
+    fig = go.Figure()
+
+    for symmetry in sorted({r['symmetry'] for r in results}):
+        for operation in sorted({r['operation'] for r in results}):
+            rows = sorted((r for r in results if r['symmetry'] == symmetry and r['operation'] == operation), key=lambda r: r['nodes'])
+            fig.add_trace(go.Scatter(x=[r['nodes'] for r in rows], y=[r['seconds'] for r in rows], mode='lines+markers',
+                                     name='{} - {}'.format(symmetry, operation)))
+
+    fig.update_xaxes(type='log', title_text='Number of nodes')
+    fig.update_yaxes(type='log', title_text='Time (s)')
+    fig.update_layout(title={'text': 'Network operation scaling', 'xanchor': 'center', 'yanchor': 'top'}, title_x=0.5)
+
+    fig.write_html(path)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Scaling benchmarks for Network operations')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[4, 8, 16, 24], help='lattice lengths to benchmark')
+    parser.add_argument('--symmetries', nargs='+', default=list(SYMMETRIES), choices=list(SYMMETRIES))
+    parser.add_argument('--backend', default='networkx', choices=['networkx', 'array'])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest is kept')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--plot', help='html file to write the scaling curves to')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline, as a fraction')
+    parser.add_argument('--minseconds', type=float, default=0.005, help='slowdowns smaller than this are ignored as noise')
+    args = parser.parse_args(argv)
+
+    results = []
+    for symmetry in args.symmetries:
+        for length in args.lengths:
+            rows = benchmarkLattice(symmetry, length, args.backend, args.repeat)
+            results.extend(rows)
+            print('{:<10} length {:>4} ({} nodes): '.format(symmetry, length, rows[0]['nodes'])
+                  + ', '.join('{} {:.3f}s'.format(r['operation'], r['seconds']) for r in rows))
+
+    exponents = scalingExponents(results)
+
+    print('\nScaling exponent k (time ~ nodes^k):')
+    for symmetry, values in exponents.items():
+        print('{:<10} '.format(symmetry) + ', '.join('{} {:.2f}'.format(op, k) for op, k in values.items()))
+
+    meta = {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.platform(), 'backend': args.backend, 'lengths': args.lengths, 'repeat': args.repeat, 'randomize': RANDOMIZE}
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results, 'exponents': exponents}, f, indent=1)
+
+    if args.plot:
+        plotScaling(results, args.plot)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        mismatched = mismatchedSettings(meta, baseline)
+        if mismatched:
+            print('\nNot comparing against {}, it was run with different settings:'.format(args.baseline))
+            for name, old, new in mismatched:
+                print('  {}: {} (baseline) vs {}'.format(name, old, new))
+            return 2
+
+        regressions = compareToBaseline(results, baseline, args.tolerance, args.minseconds)
+
+        if regressions:
+            print('\n{} regression(s) against {}:'.format(len(regressions), args.baseline))
+            for symmetry, length, operation, old, new in regressions:
+                print('  {:<10} length {:>4} {:<18} {:.3f}s -> {:.3f}s ({:+.0%})'.format(symmetry, length, operation, old, new, new/old - 1))
+            return 1
+
+        print('\nNo regressions against {}'.format(args.baseline))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
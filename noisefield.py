@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from noise import snoise4 as _snoise4
+
+'''
+Batched simplex noise for Network.randomize().
+snoise4 below is a NumPy port of the 4D simplex noise from the noise library (Casey Duncan, MIT licence) --> same tables and
+the same float32 arithmetic, so it gives the same values as noise.snoise4, but for whole arrays of points in one call
+instead of one point per Python call. displacementField() uses it to get the randomization vector of every node at once.
+'''
+
+
+F4 = np.float32(0.30901699437494745)    # (sqrt(5) - 1)/4
+G4 = np.float32(0.1381966011250105)     # (5 - sqrt(5))/20
+
+GRAD4 = np.array([
+    [0, 1, 1, 1], [0, 1, 1, -1], [0, 1, -1, 1], [0, 1, -1, -1],
+    [0, -1, 1, 1], [0, -1, 1, -1], [0, -1, -1, 1], [0, -1, -1, -1],
+    [1, 0, 1, 1], [1, 0, 1, -1], [1, 0, -1, 1], [1, 0, -1, -1],
+    [-1, 0, 1, 1], [-1, 0, 1, -1], [-1, 0, -1, 1], [-1, 0, -1, -1],
+    [1, 1, 0, 1], [1, 1, 0, -1], [1, -1, 0, 1], [1, -1, 0, -1],
+    [-1, 1, 0, 1], [-1, 1, 0, -1], [-1, -1, 0, 1], [-1, -1, 0, -1],
+    [1, 1, 1, 0], [1, 1, -1, 0], [1, -1, 1, 0], [1, -1, -1, 0],
+    [-1, 1, 1, 0], [-1, 1, -1, 0], [-1, -1, 1, 0], [-1, -1, -1, 0]], dtype=np.float32)
+
+PERM = np.tile(np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140, 36, 103, 30, 69, 142, 8,
+    99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35,
+    11, 32, 57, 177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71, 134,
+    139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133, 230, 220, 105, 92, 41, 55, 46,
+    245, 40, 244, 102, 143, 54, 65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169,
+    200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64, 52, 217, 226, 250, 124,
+    123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206, 59, 227, 47, 16, 58, 17, 182, 189, 28,
+    42, 223, 183, 170, 213, 119, 248, 152, 2, 44, 154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9,
+    129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178, 185, 112, 104, 218, 246, 97, 228, 251,
+    34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51, 145, 235, 249, 14, 239, 107, 49, 192,
+    214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121, 50, 45, 127, 4, 150, 254, 138, 236, 205,
+    93, 222, 114, 67, 29, 24, 72, 243, 141, 128, 195, 78, 66, 215, 61, 156, 180], dtype=np.int64), 2)
+
+# rank of each coordinate inside the simplex, indexed by the 6 pairwise comparisons of x0, y0, z0, w0 (only 24 of the 64 are reachable)
+SIMPLEX = np.array([[int(c) for c in rank] for rank in (
+    '0123 0132 0000 0231 0000 0000 0000 1230 0213 0000 0312 0321 0000 0000 0000 1320 '
+    '0000 0000 0000 0000 0000 0000 0000 0000 1203 0000 1302 0000 0000 0000 2301 2310 '
+    '1023 1032 0000 0000 0000 2031 0000 2130 0000 0000 0000 0000 0000 0000 0000 0000 '
+    '2013 0000 0000 0000 3012 3021 0000 3120 2103 0000 0000 0000 3102 0000 3201 3210').split()], dtype=np.int64)
+
+
+def snoise4(x, y, z, w):
+    '''
+    4D simplex noise evaluated for whole arrays at once, values between -1 and 1
+    x, y, z, w = arrays (or scalars) that broadcast against each other
+    returns a float32 array with the broadcast shape
+    '''
+
+    x, y, z, w = (np.asarray(v, dtype=np.float32) for v in np.broadcast_arrays(x, y, z, w))
+
+    # skew into the simplex grid to find which cell we are in
+    s = (x + y + z + w) * F4
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    k = np.floor(z + s)
+    l = np.floor(w + s)
+    t = (i + j + k + l) * G4
+
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+    z0 = z - (k - t)
+    w0 = w - (l - t)
+
+    c = (x0 > y0)*32 + (x0 > z0)*16 + (y0 > z0)*8 + (x0 > w0)*4 + (y0 > w0)*2 + (z0 > w0)
+    rank = SIMPLEX[c]
+
+    I = i.astype(np.int64) & 255
+    J = j.astype(np.int64) & 255
+    K = k.astype(np.int64) & 255
+    L = l.astype(np.int64) & 255
+
+    total = np.zeros(x.shape, dtype=np.float32)
+
+    # the 5 corners of the simplex --> offsets of corner n are the coordinates whose rank is >= 4-n
+    for n in range(5):
+        offset = (rank >= 4 - n).astype(np.int64) if n != 0 else np.zeros(rank.shape, dtype=np.int64)
+
+        xn = x0 - offset[..., 0].astype(np.float32) + np.float32(n)*G4
+        yn = y0 - offset[..., 1].astype(np.float32) + np.float32(n)*G4
+        zn = z0 - offset[..., 2].astype(np.float32) + np.float32(n)*G4
+        wn = w0 - offset[..., 3].astype(np.float32) + np.float32(n)*G4
+
+        gi = PERM[I + offset[..., 0] + PERM[J + offset[..., 1] + PERM[K + offset[..., 2] + PERM[L + offset[..., 3]]]]] & 0x1f
+        grad = GRAD4[gi]
+
+        tn = np.float32(0.6) - xn*xn - yn*yn - zn*zn - wn*wn
+        tn = np.where(tn >= 0, tn*tn, np.float32(0))
+
+        total = total + tn*tn*(grad[..., 0]*xn + grad[..., 1]*yn + grad[..., 2]*zn + grad[..., 3]*wn)
+
+    return (27.0*total.astype(np.float64)).astype(np.float32)
+
+
+def _randVectors(coords, w, backend):
+    '''
+    the randomization vectors for an (N, 3) array of coordinates, given the (N, 4) random shifts w along the 4th noise dimension
+    '''
+
+    x, y, z = (coords[:, i, None] for i in range(3))
+
+    if backend == 'numpy':
+        noisevalues = np.abs(snoise4(x, y, z, w)).astype(float)
+    elif backend == 'noise':
+        noisevalues = np.abs(np.vectorize(_snoise4, otypes=[float])(x, y, z, w))
+    else:
+        raise ValueError("backend must be 'numpy' or 'noise', got {}".format(backend))
+
+    with np.errstate(divide='ignore'):
+        randvector = np.column_stack((np.sqrt(-2*np.log(noisevalues[:, 0]))*np.cos(2*np.pi*noisevalues[:, 1]),
+                                      noisevalues[:, 2],
+                                      np.arccos(1 - 2*noisevalues[:, 3])))
+
+    return randvector
+
+
+def displacementField(coords, seed=None, backend='numpy', workers=1, splits=None, executor=None):
+    '''
+    Generates the randomization vector of every node at once, implementing Perlin (simplex) noise
+    coords = (N, 3) array of node coordinates --> row n of the result is the vector for row n of coords
+    seed = anything np.random.default_rng accepts (int, Generator, None) --> same seed gives the same field
+    backend = 'numpy' (batched, default) or 'noise' (calls the noise library's C snoise4 once per value, slow, kept as a reference)
+    workers = number of threads to evaluate the field on, the result doesn't depend on it
+    splits = optional sorted row indices where the rows may be cut into independent groups (e.g. neighbourhoods) for the workers
+    executor = optional concurrent.futures executor (e.g. a ProcessPoolExecutor with workers processes) to run the groups on instead of threads
+    returns an (N, 3) float array
+    '''
+
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    rng = np.random.default_rng(seed)
+
+    # like the old getRandVector: 4 noise values per node, each shifted along w by its own random number so the noise can be seeded
+    # all random numbers are drawn up front so splitting the work between threads doesn't change them
+    w = rng.random((len(coords), 4))
+
+    if workers <= 1 or len(coords) < 2:
+        return _randVectors(coords, w, backend)
+
+    # cut at the first allowed split after each of the evenly spaced points
+    splits = np.arange(1, len(coords)) if splits is None else np.asarray(splits, dtype=int)
+    if len(splits) != 0:
+        targets = np.linspace(0, len(coords), 4*workers + 1)[1:-1]
+        splits = np.unique(splits[np.minimum(np.searchsorted(splits, targets), len(splits) - 1)])
+
+    bounds = np.concatenate(([0], splits, [len(coords)])).astype(int)
+    pieces = [(coords[a:b], w[a:b], backend) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    if executor is not None:
+        return np.concatenate(list(executor.map(_randVectors, *zip(*pieces))))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(lambda piece: _randVectors(*piece), pieces)))
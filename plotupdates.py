@@ -0,0 +1,74 @@
+import numpy as np
+
+from Network import subsampleEdges
+
+'''
+Incremental plot updates for the Dash app.
+Instead of sending a whole plotly figure (every coordinate and every edge as line points) after each operation, the browser keeps
+the lattice geometry (node coordinates + edges as pairs of node labels) and builds the figure itself. After that the server only
+sends what changed since the geometry the browser has --> the moved nodes, the added and removed edges, or the histogram bins.
+See app.py for the browser side (applyGeometry)
+'''
+
+
+def plotGeometry(graph, maxedges=None):
+    '''
+    returns the geometry of a Network to draw --> {'coords': (N, 3) float array (nan for removed nodes), 'edges': (E, 2) int array}
+    maxedges = most edges to draw, past that an even subsample is drawn like in Network.visualizeGraph
+    '''
+
+    coords = np.array(graph._positions(), dtype=float) if graph.nodexvals is not None else np.empty((0, 3))
+    edges = np.sort(graph._edges(), axis=1) if len(coords) != 0 else np.empty((0, 2), dtype=np.intp)
+
+    if maxedges is not None and len(edges) > maxedges:
+        edges = subsampleEdges(coords, edges, maxedges)
+
+    return {'coords': coords, 'edges': edges[np.lexsort((edges[:, 1], edges[:, 0]))]}
+
+
+def _jsonCoords(coords):
+    # nan isn't valid JSON, removed nodes are sent as null
+    return [None if np.isnan(row).any() else row for row in np.round(coords, 6).tolist()]
+
+
+def geometryDelta(old, new):
+    '''
+    returns the smallest update that turns the geometry old (what the browser has, None if nothing) into new, as a JSON-able dict
+    {'reset': True, 'coords', 'edges'} --> replace everything (first plot, node labels changed, or the update wouldn't be smaller)
+    {'reset': False, 'index', 'coords', 'added', 'removed'} --> set the coordinates of the nodes in index, then remove/add those edges
+    '''
+
+    coords, edges = new['coords'], new['edges']
+    reset = {'reset': True, 'coords': _jsonCoords(coords), 'edges': edges.tolist()}
+
+    if old is None or len(old['coords']) != len(coords):
+        return reset
+
+    # nan != nan, so removed nodes only count as changed if they were alive before
+    moved = (old['coords'] != coords) & ~(np.isnan(old['coords']) & np.isnan(coords))
+    index = np.flatnonzero(moved.any(axis=1))
+
+    # edges as single integers so the two lists can be compared as sets
+    n = len(coords)
+    oldkeys = old['edges'][:, 0].astype(np.int64)*n + old['edges'][:, 1]
+    newkeys = edges[:, 0].astype(np.int64)*n + edges[:, 1]
+
+    added = edges[~np.isin(newkeys, oldkeys)]
+    removed = old['edges'][~np.isin(oldkeys, newkeys)]
+
+    # numbers sent --> 3 per moved node and 2 per changed edge, against starting over
+    if 3*len(index) + 2*(len(added) + len(removed)) >= 3*len(coords) + 2*len(edges):
+        return reset
+
+    return {'reset': False, 'index': index.tolist(), 'coords': _jsonCoords(coords[index]),
+            'added': added.tolist(), 'removed': removed.tolist()}
+
+
+def histogramBins(histogram, centers=True):
+    '''
+    returns the bins of a Histogram (see Histogram.py) as a JSON-able dict --> all the browser needs to draw it as a bar chart
+    centers = False to label each bar with the start of its bin instead (e.g. valence k for the bin [k, k+1))
+    '''
+
+    x = histogram.centers if centers else histogram.edges[:-1]
+    return {'x': x.tolist(), 'y': histogram.counts.tolist(), 'width': float(histogram.width)}
@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+'''
+Ring statistics for Network.findRings().
+The shortest ring through an edge (u, v) is one more than the shortest path from u to v that doesn't use the edge itself. It is found
+with a BFS grown from both ends at once (each side only goes about half the ring size deep) that stops as soon as no shorter path is
+possible or the path would be longer than maxring --> the cost per edge only depends on the local structure, not the lattice size.
+The edges are independent, so they are split into chunks that run on a pool of processes.
+'''
+
+
+# CSR adjacency of the lattice as Python lists, set once in every worker process (see _setGraph)
+_indptr = None
+_indices = None
+
+
+def _setGraph(indptr, indices):
+    global _indptr, _indices
+    _indptr = indptr.tolist()
+    _indices = indices.tolist()
+
+
+def shortestRing(u, v, maxring):
+    '''
+    returns the number of edges of the shortest ring through the edge (u, v), 0 if there is none with at most maxring edges
+    uses the adjacency set by _setGraph()
+    '''
+
+    limit = maxring - 1         # longest path from u to v (without the edge) worth finding
+    dist = ({u: 0}, {v: 0})
+    frontier = ([u], [v])
+    level = [0, 0]
+    best = limit + 1
+
+    # every path of length up to level[0] + level[1] has been seen once both sides are that deep
+    while level[0] + level[1] < min(best, limit) and frontier[0] and frontier[1]:
+        side = 0 if len(frontier[0]) <= len(frontier[1]) else 1
+        mine, other = dist[side], dist[1 - side]
+        start, end = (u, v) if side == 0 else (v, u)
+
+        level[side] += 1
+        nextfrontier = []
+
+        for x in frontier[side]:
+            for y in _indices[_indptr[x]:_indptr[x+1]]:
+                if y in mine or (x == start and y == end):
+                    continue
+                mine[y] = level[side]
+                nextfrontier.append(y)
+                if y in other:
+                    best = min(best, level[side] + other[y])
+
+        frontier[side][:] = nextfrontier
+
+    return best + 1 if best <= limit else 0
+
+
+def _ringChunk(edges, maxring):
+    return np.array([shortestRing(u, v, maxring) for u, v in edges.tolist()], dtype=np.int64)
+
+
+def edgeRings(indptr, indices, edges, maxring=12, processes=None, chunk=4096):
+    '''
+    returns the shortest ring size through every edge of an (E, 2) array (0 = none up to maxring)
+    indptr, indices = CSR adjacency of the graph
+    processes = None to run in this process, or the number of worker processes to spread the edges over
+    '''
+
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    pieces = [edges[start:start + chunk] for start in range(0, len(edges), chunk)]
+
+    if len(pieces) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if processes is None:
+        _setGraph(indptr, indices)
+        return np.concatenate([_ringChunk(piece, maxring) for piece in pieces])
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_setGraph, initargs=(indptr, indices)) as pool:
+        return np.concatenate(list(pool.map(_ringChunk, pieces, [maxring]*len(pieces))))
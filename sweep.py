@@ -0,0 +1,144 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import Network as nwrk
+from Histogram import Histogram
+
+'''
+Parameter sweeps over randomized lattices, for finding which settings make a lattice look like a natural structure.
+Every combination of symmetry, length, chaosmult, minrad, maxrad, deadend/kink handling and seed is one run: generate, randomize, clean up
+(same stages as the Dash app, see Network.refinementStages) and measure. The runs are independent, so they are spread over a pool of
+processes and the time goes down with the number of cores. The degree and angle histograms, node/edge counts and timings of every run
+end up in one columnar table (one array per column, row n = run n) that is written to an .npz file (and optionally a .csv)
+
+Examples:
+    python sweep.py --chaosmult 0.1 0.2 0.3 --maxrad 1.1 1.3 --deadends prune connect nada --seeds 10 --output sweep.npz
+    python sweep.py --symmetries BCC Hexagonal --length 12 --workers 8 --csv sweep.csv
+
+Set OMP_NUM_THREADS=1 (or similar for your BLAS) when using many workers, otherwise every process tries to use every core
+'''
+
+
+SYMMETRIES = {'Cubic': 'setCubicSymmetry', 'BCC': 'setBodyCenterCubic', 'Hexagonal': 'setHexagonalSymmetry'}
+
+MAXDEGREE = 16          # degree histogram bins are 0, 1, ..., MAXDEGREE-1 (higher valences only show up in degreemax)
+ANGLEBINWIDTH = 1       # width of the angle histogram bins in degrees
+
+
+def sweepGrid(symmetries=('Cubic',), lengths=(8,), chaosmults=(0.15,), minrads=(0.6,), maxrads=(1.1,), deadends=('nada',),
+              kinks=(False,), seeds=(0,)):
+    '''
+    returns one dict of parameters per run, for every combination of the given values
+    '''
+
+    names = ('symmetry', 'length', 'chaosmult', 'minrad', 'maxrad', 'deadends', 'kinks', 'seed')
+    values = (symmetries, lengths, chaosmults, minrads, maxrads, deadends, kinks, seeds)
+
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def runOne(run, backend='array'):
+    '''
+    generates, randomizes and cleans up one lattice with the parameters in run (a dict from sweepGrid()), returns its measurements
+    '''
+
+    start = time.perf_counter()
+
+    graph = nwrk.Network(backend)
+    stages = [(SYMMETRIES[run['symmetry']], {'length': run['length']}),
+              ('randomize', {'chaosmult': run['chaosmult'], 'minrad': run['minrad'], 'maxrad': run['maxrad'], 'seed': run['seed']})]
+    stages += nwrk.refinementStages(deadends=run['deadends'], kinks=run['kinks'])
+    stages.append(('findAngles', {'accumulate': True, 'unordered': True, 'binwidth': ANGLEBINWIDTH}))
+
+    graph.runPipeline(stages, trackmemory=False)
+
+    degrees = np.array([val for (node, val) in graph.G.degree()], dtype=np.int64)
+    degreehist = Histogram(0, MAXDEGREE, MAXDEGREE)
+    degreehist.add(degrees)
+
+    return {'nodes': graph.G.number_of_nodes(), 'edges': graph.G.number_of_edges(), 'seconds': time.perf_counter() - start,
+            'degree': degreehist.counts, 'degreemean': degreehist.mean if degreehist.count != 0 else np.nan,
+            'degreemax': int(degrees.max()) if len(degrees) != 0 else 0,
+            'angles': graph.anglehist.counts, 'anglemean': graph.anglehist.mean if graph.anglehist.count != 0 else np.nan,
+            'anglestd': graph.anglehist.std}
+
+
+def runSweep(runs, workers=None, backend='array'):
+    '''
+    runs every parameter dict in runs on a pool of workers processes (None = one per core, 1 = in this process)
+    returns the results as a columnar table --> dict of column name: array with one row per run, in the order of runs
+    the parameters are columns too, 'degree' and 'angles' are (runs, bins) arrays of histogram counts
+    '''
+
+    workers = os.cpu_count() if workers is None else workers
+
+    if workers <= 1:
+        results = [runOne(run, backend) for run in runs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(runOne, runs, itertools.repeat(backend), chunksize=max(1, len(runs)//(4*workers))))
+
+    table = {name: np.array([run[name] for run in runs]) for name in (runs[0] if len(runs) != 0 else [])}
+    for name in ('nodes', 'edges', 'seconds', 'degree', 'degreemean', 'degreemax', 'angles', 'anglemean', 'anglestd'):
+        table[name] = np.array([result[name] for result in results])
+
+    table['degreebins'] = np.arange(MAXDEGREE)
+    table['anglebins'] = Histogram(0, 180, int(np.ceil(180/ANGLEBINWIDTH))).edges
+
+    return table
+
+
+def writeCSV(table, path):
+    '''
+    writes a sweep table to a csv file, one line per run, the histograms spread over degree_0, degree_1, ... and angle_0, angle_1, ... columns
+    '''
+
+    columns = {name: values for name, values in table.items() if name not in ('degree', 'angles', 'degreebins', 'anglebins')}
+    columns.update({'degree_{}'.format(k): table['degree'][:, k] for k in range(table['degree'].shape[1])})
+    columns.update({'angle_{}'.format(k): table['angles'][:, k] for k in range(table['angles'].shape[1])})
+
+    with open(path, 'w') as f:
+        f.write(','.join(columns) + '\n')
+        for row in zip(*columns.values()):
+            f.write(','.join(str(value) for value in row) + '\n')
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Parameter sweeps over randomized lattices')
+    parser.add_argument('--symmetries', nargs='+', default=['Cubic'], choices=list(SYMMETRIES))
+    parser.add_argument('--lengths', type=int, nargs='+', default=[8])
+    parser.add_argument('--chaosmult', type=float, nargs='+', default=[0.15])
+    parser.add_argument('--minrad', type=float, nargs='+', default=[0.6])
+    parser.add_argument('--maxrad', type=float, nargs='+', default=[1.1])
+    parser.add_argument('--deadends', nargs='+', default=['nada'], choices=['prune', 'connect', 'nada'])
+    parser.add_argument('--kinks', nargs='+', default=['yeskinks'], choices=['yeskinks', 'nokinks'], help='nokinks straightens kinks, like the app')
+    parser.add_argument('--seeds', type=int, default=1, help='number of seeds per combination (0, 1, ...)')
+    parser.add_argument('--workers', type=int, default=None, help='processes to run on, one per core by default')
+    parser.add_argument('--backend', default='array', choices=['networkx', 'array'])
+    parser.add_argument('--output', default='sweep_results.npz', help='where to write the results table')
+    parser.add_argument('--csv', help='also write the table to this csv file')
+    args = parser.parse_args(argv)
+
+    runs = sweepGrid(args.symmetries, args.lengths, args.chaosmult, args.minrad, args.maxrad, args.deadends,
+                     [k == 'nokinks' for k in args.kinks], range(args.seeds))
+
+    start = time.perf_counter()
+    table = runSweep(runs, workers=args.workers, backend=args.backend)
+    print('{} runs in {:.1f}s'.format(len(runs), time.perf_counter() - start))
+
+    np.savez(args.output, **table)
+    if args.csv:
+        writeCSV(table, args.csv)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())